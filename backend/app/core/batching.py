@@ -0,0 +1,66 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+class AsyncBatcher:
+    """
+    Micro-batching scheduler: concurrent submit() calls are collected for up to
+    max_latency_ms (or until max_batch_size items) and handed to one handler call
+    """
+    
+    def __init__(
+        self,
+        handler: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = 8,
+        max_latency_ms: float = 5
+    ):
+        # handler returns one result per item, in order; an exception instance fails only its item
+        self._handler = handler
+        self._max_batch_size = max_batch_size
+        self._max_latency = max_latency_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+    
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result from the next batch"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+    
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future]]:
+        """Wait for a first item, then take more until the batch is full or the window closes"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self._max_latency
+        while len(batch) < self._max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+    
+    async def _run(self):
+        """Background loop dispatching collected batches to the handler"""
+        while True:
+            batch = await self._collect()
+            try:
+                results = await self._handler([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
@@ -17,6 +17,9 @@ class Settings(BaseSettings):
     AWS_SECRET_ACCESS_KEY: Optional[str] = None
     AWS_S3_BUCKET: str = "tailorai-images"
     AWS_REGION: str = "us-east-1"
+    CDN_DOMAIN: Optional[str] = None  # CloudFront domain fronting the S3 bucket
+    PRESIGNED_URL_EXPIRY: int = 3600  # Seconds
+    SIGNED_GET_URL_EXPIRY: int = 7 * 24 * 3600  # Seconds; read URLs for private objects without a CDN (SigV4 maximum)
     
     # Alternative: Google Cloud Storage
     GCS_BUCKET_NAME: Optional[str] = None
@@ -28,11 +31,15 @@ class Settings(BaseSettings):
     # API Settings
     API_V1_STR: str = "/api/v1"
     PROJECT_NAME: str = "TailorAI"
+    LOG_LEVEL: str = "INFO"
     
     # Model Settings
     FRAME_SAMPLE_RATE: int = 5  # Process every 5th frame
     CONFIDENCE_THRESHOLD: float = 0.5
     MAX_FRAMES_PER_REQUEST: int = 10
+    OPENAI_MAX_CONCURRENCY: int = 16  # In-flight OpenAI requests per process
+    SAM_CONCURRENCY: int = 1  # Frames in SAM at once per process; above 1 only frame decoding overlaps (one predictor)
+    PRELOAD_YOLO: bool = False  # Load and warm up YOLO at startup instead of on first use
     
     # Style Analysis
     MAX_STYLE_IMAGES: int = 5
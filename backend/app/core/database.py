@@ -3,8 +3,8 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 
-# Create database engine
-engine = create_engine(settings.DATABASE_URL)
+# Create database engine (larger compiled-statement cache than the default 500)
+engine = create_engine(settings.DATABASE_URL, query_cache_size=1200)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -0,0 +1,17 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Optional Numba JIT for small numeric kernels; without it, decorated functions run as plain Python
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    logger.info("numba not available - JIT kernels will use NumPy fallbacks")
+
+    def njit(*args, **kwargs):
+        """No-op stand-in for numba.njit, usable with or without arguments"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
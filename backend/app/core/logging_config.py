@@ -0,0 +1,29 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+
+from app.core.config import settings
+
+_listener = None
+
+def setup_logging():
+    """
+    Route all log records through a QueueHandler so request handlers only enqueue;
+    a QueueListener thread does the actual stdout writes
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.Queue(-1)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(settings.LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
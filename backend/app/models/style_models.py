@@ -1,8 +1,24 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, JSON, LargeBinary, text
+from sqlalchemy.orm import relationship, Session
 from sqlalchemy.sql import func
+from typing import List, Optional
+import json
+import numpy as np
 from app.core.database import Base
 
+# Embeddings are persisted as little-endian float16 bytes
+EMBEDDING_DTYPE = np.dtype("<f2")
+
+def pack_embedding(embedding) -> bytes:
+    """L2-normalize an embedding and pack it into a float16 blob"""
+    vector = np.asarray(embedding, dtype=np.float32)
+    vector = vector / np.sqrt(np.vdot(vector, vector))
+    return vector.astype(EMBEDDING_DTYPE).tobytes()
+
+def unpack_embedding(blob: bytes) -> np.ndarray:
+    """Unpack a float16 embedding blob into a float32 vector"""
+    return np.frombuffer(blob, dtype=EMBEDDING_DTYPE).astype(np.float32)
+
 class Style(Base):
     """Style model for storing style profiles"""
     __tablename__ = "styles"
@@ -25,12 +41,57 @@ class StyleImage(Base):
     __tablename__ = "style_images"
     
     id = Column(Integer, primary_key=True, index=True)
-    style_id = Column(Integer, ForeignKey("styles.id"), nullable=False)
+    style_id = Column(Integer, ForeignKey("styles.id"), index=True, nullable=False)
     image_url = Column(String(500), nullable=False)
     image_type = Column(String(50), default="reference")  # reference, thumbnail, etc.
-    embedding = Column(JSON, nullable=True)  # CLIP embedding vector
+    embedding = Column(LargeBinary, nullable=True)  # CLIP embedding, see pack_embedding
     image_metadata = Column(JSON, nullable=True)  # Image metadata (size, format, etc.)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
     style = relationship("Style", back_populates="images")
+
+def add_style_images(
+    db: Session,
+    style_id: str,
+    image_urls: List[str],
+    embeddings: Optional[np.ndarray] = None,
+    tags: Optional[List[str]] = None,
+    description: Optional[str] = None
+) -> Style:
+    """
+    Stage a style's image rows (with packed embeddings when given), creating the style
+    row on first use; everything goes in with one add_all so the commit batches the INSERTs
+    """
+    style = db.query(Style).filter(Style.style_id == style_id).one_or_none()
+    if style is None:
+        style = Style(style_id=style_id, description=description, tags=tags)
+    elif tags is not None:
+        style.tags = tags
+    
+    blobs = [pack_embedding(e) for e in embeddings] if embeddings is not None else [None] * len(image_urls)
+    db.add_all([style, *(
+        StyleImage(style=style, image_url=url, embedding=blob)
+        for url, blob in zip(image_urls, blobs)
+    )])
+    return style
+
+def repack_json_embeddings(connection) -> int:
+    """
+    Convert embeddings written while the column was JSON into float16 blobs, in place.
+    SQLite keeps the old declared type but stores blobs as-is, so only the values need
+    rewriting; returns the number of rows converted
+    """
+    if connection.dialect.name != "sqlite":
+        return 0
+    
+    rows = connection.execute(text(
+        "SELECT id, embedding FROM style_images WHERE typeof(embedding) = 'text'"
+    )).all()
+    if rows:
+        params = []
+        for row_id, value in rows:
+            vector = json.loads(value)
+            params.append({"id": row_id, "embedding": pack_embedding(vector) if vector else None})
+        connection.execute(text("UPDATE style_images SET embedding = :embedding WHERE id = :id"), params)
+    return len(rows)
@@ -1,17 +1,21 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, Index
 from sqlalchemy.sql import func
 from app.core.database import Base
 
 class User(Base):
     """User model for storing user information"""
     __tablename__ = "users"
+    __table_args__ = (
+        # Sign-in looks users up by provider and provider id together
+        Index("ix_users_auth", "auth_provider", "auth_provider_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String(100), unique=True, index=True, nullable=False)
     email = Column(String(255), unique=True, index=True, nullable=True)
     name = Column(String(255), nullable=True)
     auth_provider = Column(String(50), nullable=True)  # firebase, cognito, etc.
-    auth_provider_id = Column(String(255), nullable=True)
+    auth_provider_id = Column(String(255), nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     is_active = Column(Integer, default=1)  # 1 for active, 0 for inactive
@@ -33,3 +37,6 @@ class UserPreferences(Base):
     size_preferences = Column(JSON, nullable=True)  # Size preferences for different garments
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+# Composite index for "latest preferences for a user" queries
+Index("ix_prefs_user_updated", UserPreferences.user_id, UserPreferences.updated_at.desc())
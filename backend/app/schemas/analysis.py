@@ -1,5 +1,6 @@
+from dataclasses import dataclass
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from enum import Enum
 
 class UserPreferences(BaseModel):
@@ -23,7 +24,13 @@ class Season(str, Enum):
 
 class AnalysisRequest(BaseModel):
     mode: AnalysisMode = Field(..., description="Analysis mode: general or style")
-    frame_b64: str = Field(..., description="Base64 encoded image frame")
+    frame_b64: str = Field(..., description="Base64 encoded image frame", repr=False)
+    season: Season = Field(default=Season.summer, description="Current season for context-aware recommendations")
+    style_profile: Optional[Dict[str, Any]] = Field(None, description="Style profile for style matching mode")
+
+class BatchAnalysisRequest(BaseModel):
+    mode: AnalysisMode = Field(..., description="Analysis mode: general or style")
+    frames_b64: List[str] = Field(..., min_length=1, description="Base64 encoded image frames", repr=False)
     season: Season = Field(default=Season.summer, description="Current season for context-aware recommendations")
     style_profile: Optional[Dict[str, Any]] = Field(None, description="Style profile for style matching mode")
 
@@ -35,11 +42,32 @@ class FeedbackItem(BaseModel):
     priority: str  # "high", "medium", "low"
     actionable: bool = True
 
+@dataclass(frozen=True, slots=True)
+class Detection:
+    """Single detector hit in pixel xyxy coordinates"""
+    cls: str
+    bbox: Tuple[float, float, float, float]
+    confidence: float
+    
+    @classmethod
+    def from_dict(cls, detection: Dict[str, Any]) -> "Detection":
+        """Build from the {"class", "bbox", "confidence"} dicts returned by the detection services"""
+        return cls(detection["class"], tuple(detection["bbox"]), detection["confidence"])
+
+@dataclass(frozen=True, slots=True)
+class Feedback:
+    """Fixed-shape feedback record built on the hot path; serialized directly by orjson"""
+    type: str
+    message: str
+    confidence: float
+    priority: str
+    actionable: bool = True
+
 class OverlayData(BaseModel):
     """Data for visual overlay"""
     bounding_boxes: List[Dict[str, Any]] = []
     keypoints: List[Dict[str, Any]] = []
-    segmentation_masks: List[str] = []  # base64 encoded masks
+    segmentation_masks: List[str] = []  # base64 tagged RLE masks (see segmentation_service)
     guide_lines: List[Dict[str, Any]] = []
     color_analysis: Optional[Dict[str, Any]] = None
 
@@ -1,6 +1,6 @@
 # backend/app/services/ai_orchestrator.py
-from typing import Optional, Dict, Any
-from app.services.openai_client import analyze_frame_b64
+from typing import Optional, Dict, Any, List, AsyncIterator, Union
+from app.services.openai_client import analyze_frame_b64, analyze_frame_bytes, analyze_frames_b64, stream_frame_b64
 
 class AIOrchestrator:
     """
@@ -11,6 +11,21 @@ class AIOrchestrator:
     """
 
     @staticmethod
-    def analyze_frame(mode: str, frame_b64: str, season: str = "summer", style_profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    async def analyze_frame(mode: str, frame_b64: str, season: str = "summer", style_profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         # Delegate to OpenAI client (structured JSON output)
-        return analyze_frame_b64(mode, frame_b64, season, style_profile)
+        return await analyze_frame_b64(mode, frame_b64, season, style_profile)
+
+    @staticmethod
+    async def analyze_frame_raw(mode: str, frame: Union[bytes, memoryview], season: str = "summer", style_profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        # Raw image bytes skip the base64 decode entirely
+        return await analyze_frame_bytes(mode, frame, season, style_profile)
+
+    @staticmethod
+    async def analyze_frames(mode: str, frames_b64: List[str], season: str = "summer", style_profile: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        # Several frames share one OpenAI request
+        return await analyze_frames_b64(mode, frames_b64, season, style_profile)
+
+    @staticmethod
+    def analyze_frame_stream(mode: str, frame_b64: str, season: str = "summer", style_profile: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        # Sections are yielded as the completion streams in
+        return stream_frame_b64(mode, frame_b64, season, style_profile)
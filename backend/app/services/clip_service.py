@@ -1,192 +1,503 @@
+import asyncio
+from dataclasses import dataclass
 import torch
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 from transformers import CLIPProcessor, CLIPModel
 import requests
+from requests.adapters import HTTPAdapter
 from PIL import Image
 import io
 import base64
+import hashlib
+import logging
 
 from app.core.config import settings
+from app.core.batching import AsyncBatcher
+from app.core.jit import njit, NUMBA_AVAILABLE
+
+logger = logging.getLogger(__name__)
+
+# Optional libjpeg-turbo decoder for faster JPEG decoding
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    TURBOJPEG_AVAILABLE = True
+except ImportError:
+    TURBOJPEG_AVAILABLE = False
+    logger.info("PyTurboJPEG not available - using PIL for JPEG decoding")
+
+# Optional Redis for caching text embeddings across requests
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+    logger.info("redis not available - text embedding cache disabled")
+
+TEXT_EMBEDDING_TTL = 86400  # Seconds to keep cached text embeddings
+IMAGE_FETCH_TIMEOUT = 10  # Seconds to wait when downloading an image URL
+
+# Concurrent encode_image calls are micro-batched into one forward pass
+CLIP_MAX_BATCH_SIZE = 16
+CLIP_BATCH_LATENCY_MS = 5
+
+# Compiled image batches are zero-padded up to one of these sizes, each captured at load
+# time, so a new batch size never triggers a recompile on the request path
+CLIP_BATCH_BUCKETS = (1, 2, 4, 8, CLIP_MAX_BATCH_SIZE)
+
+# Every CLIP embedding used here is 512-d; the int8 kernel is specialized for that length
+EMBEDDING_DIM = 512
+
+if NUMBA_AVAILABLE:
+    @njit("int32[::1](int8[:, ::1], int8[::1])", cache=True, boundscheck=False)
+    def _int8_dots_512(rows, query):
+        """int32 dot product of an int8 query with every 512-d int8 row"""
+        out = np.empty(rows.shape[0], np.int32)
+        for r in range(rows.shape[0]):
+            # Fixed trip count lets LLVM fully unroll and vectorize the widening multiply-add
+            acc = np.int32(0)
+            for i in range(512):
+                acc += np.int32(rows[r, i]) * np.int32(query[i])
+            out[r] = acc
+        return out
+else:
+    def _int8_dots_512(rows, query):
+        """int32 dot product of an int8 query with every 512-d int8 row"""
+        # int8 operands are widened in buffered chunks, never as a full int32 copy of the rows
+        return np.einsum("j,ij->i", query, rows, dtype=np.int32)
+
+@dataclass(frozen=True, slots=True)
+class QuantizedEmbeddings:
+    """Int8 embedding rows with a float32 scale per row; row i is approximately values[i] * scales[i]"""
+    values: np.ndarray
+    scales: np.ndarray
+    
+    def __len__(self) -> int:
+        return len(self.values)
+    
+    @staticmethod
+    def quantize(embeddings) -> "QuantizedEmbeddings":
+        """Symmetric int8 quantization scaled so each row's largest component maps to +-127"""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        scales = np.abs(vectors).max(axis=-1, keepdims=True) / 127
+        scales[scales == 0] = 1
+        values = np.rint(vectors / scales).astype(np.int8)
+        return QuantizedEmbeddings(values, scales[..., 0])
+    
+    def stack(self, other: "QuantizedEmbeddings") -> "QuantizedEmbeddings":
+        """Rows of self followed by rows of other; rows are quantized independently"""
+        return QuantizedEmbeddings(
+            np.vstack([self.values, other.values]), np.concatenate([self.scales, other.scales])
+        )
+    
+    def dot(self, queries: np.ndarray) -> np.ndarray:
+        """Dot products of a (D,) or (G, D) float query against every row: (N,) or (G, N)"""
+        query = QuantizedEmbeddings.quantize(np.asarray(queries, dtype=np.float32).reshape(-1, EMBEDDING_DIM))
+        raw = np.empty((len(query), len(self)), dtype=np.int32)
+        for g, query_row in enumerate(query.values):
+            raw[g] = _int8_dots_512(self.values, query_row)
+        # 512 * 127 * 127 < 2**24, so the int32 sums are exact in float32
+        similarities = raw.astype(np.float32) * self.scales * query.scales[:, None]
+        return similarities.reshape(np.shape(queries)[:-1] + (len(self),))
 
 class CLIPService:
     """CLIP service for style embeddings and similarity scoring"""
     
+    # Every embedding produced or stored by this service is L2-normalized,
+    # so cosine similarity reduces to a plain dot product
+    embeddings_normalized = True
+    
     def __init__(self):
         self.model = None
         self.processor = None
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self._tj = None
+        self.redis = None
+        # True once the feature extractors are compiled and warmed at fixed input shapes
+        self._compiled = False
+        
+        self._image_batcher = AsyncBatcher(
+            self._encode_image_batch, CLIP_MAX_BATCH_SIZE, CLIP_BATCH_LATENCY_MS
+        )
+        
+        # Pooled HTTP session so image downloads reuse TCP/TLS connections
+        self._http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=2)
+        self._http.mount("https://", adapter)
+        self._http.mount("http://", adapter)
+        
+        if REDIS_AVAILABLE:
+            try:
+                self.redis = redis.Redis.from_url(
+                    settings.REDIS_URL, socket_connect_timeout=0.5, socket_timeout=0.5
+                )
+            except Exception as e:
+                logger.warning("Error initializing Redis client: %s", e)
+        
+        if TURBOJPEG_AVAILABLE:
+            try:
+                self._tj = TurboJPEG()
+            except Exception as e:
+                logger.warning("Error initializing TurboJPEG: %s", e)
     
     async def load_model(self):
         """Load CLIP model"""
         try:
-            print("Loading CLIP model...")
+            logger.info("Loading CLIP model...")
             self.model = CLIPModel.from_pretrained(settings.CLIP_MODEL_NAME)
             self.processor = CLIPProcessor.from_pretrained(settings.CLIP_MODEL_NAME)
             
             self.model.to(self.device)
             self.model.eval()
-            print("CLIP model loaded successfully")
+            
+            # Half precision doubles tensor-core throughput on GPU
+            if self.device == "cuda":
+                self.model.half()
+            
+            self._compile_model()
+            logger.info("CLIP model loaded successfully")
         except Exception as e:
-            print(f"Error loading CLIP model: {e}")
+            logger.warning("Error loading CLIP model: %s", e)
             # Fallback to mock model for development
             self.model = None
     
-    async def encode_image(self, image_input: str) -> List[float]:
+    def _compile_model(self):
+        """Compile the feature extractors and warm them up so requests skip compile cost"""
+        if not hasattr(torch, "compile"):
+            return
+        
+        eager_image_features = self.model.get_image_features
+        eager_text_features = self.model.get_text_features
+        try:
+            self.model.get_image_features = torch.compile(
+                eager_image_features, mode="reduce-overhead", fullgraph=False, dynamic=False
+            )
+            self.model.get_text_features = torch.compile(
+                eager_text_features, mode="reduce-overhead", fullgraph=False, dynamic=False
+            )
+            
+            # Dummy forward passes trigger compilation at load time, once per shape
+            # that requests can produce: every image batch bucket and max-length text
+            dummy_image = Image.new("RGB", (224, 224))
+            pixel_values = self._to_device(
+                self.processor(images=dummy_image, return_tensors="pt", padding=True)
+            )["pixel_values"]
+            text_inputs = self._to_device(
+                self.processor(text="warmup", return_tensors="pt", padding="max_length")
+            )
+            with torch.inference_mode():
+                for batch_size in CLIP_BATCH_BUCKETS:
+                    self.model.get_image_features(
+                        pixel_values=pixel_values.expand(batch_size, -1, -1, -1).contiguous()
+                    )
+                self.model.get_text_features(**text_inputs)
+            self._compiled = True
+        except Exception as e:
+            logger.warning("CLIP compilation unavailable, using eager mode: %s", e)
+            self.model.get_image_features = eager_image_features
+            self.model.get_text_features = eager_text_features
+            self._compiled = False
+    
+    @staticmethod
+    def normalize(embedding) -> np.ndarray:
+        """L2-normalize a vector, or each row of a matrix"""
+        vectors = np.array(embedding, dtype=np.float32)
+        norms = np.sqrt(np.einsum("...i,...i->...", vectors, vectors))
+        return vectors / np.expand_dims(norms, -1)
+    
+    @staticmethod
+    def top_k(similarities: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k largest similarities, best first, via O(N) partition plus a k-sized sort"""
+        k = min(k, len(similarities))
+        if k <= 0:
+            return np.empty(0, dtype=np.intp)
+        idx = np.argpartition(similarities, -k)[-k:]
+        return idx[np.argsort(similarities[idx])[::-1]]
+    
+    def _to_device(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Move processor outputs to the model device, matching fp16 weights on GPU"""
+        if self.device == "cuda":
+            return {
+                k: v.to(self.device).half() if v.dtype == torch.float32 else v.to(self.device)
+                for k, v in inputs.items()
+            }
+        return {k: v.to(self.device) for k, v in inputs.items()}
+    
+    def _decode_image_bytes(self, raw_bytes: bytes) -> Union[np.ndarray, Image.Image]:
+        """Decode image bytes, using libjpeg-turbo straight to an RGB array for JPEGs"""
+        if self._tj is not None and raw_bytes[:2] == b"\xff\xd8":
+            return self._tj.decode(raw_bytes, pixel_format=TJPF_RGB)
+        return Image.open(io.BytesIO(raw_bytes)).convert("RGB")
+    
+    def _load_image(self, image_input) -> Union[np.ndarray, Image.Image]:
+        """Load an image from a URL, data URL, raw bytes or file path"""
+        if isinstance(image_input, bytes):
+            return self._decode_image_bytes(image_input)
+        if image_input.startswith('http'):
+            # Download image from URL over the pooled session
+            with self._http.get(image_input, timeout=IMAGE_FETCH_TIMEOUT, stream=True) as response:
+                response.raise_for_status()
+                return self._decode_image_bytes(response.raw.read(decode_content=True))
+        if image_input.startswith('data:image'):
+            # Base64 encoded image
+            image_data = image_input.split(',', 1)[1]
+            return self._decode_image_bytes(base64.b64decode(image_data, validate=False))
+        # Assume it's a file path
+        return Image.open(image_input)
+    
+    async def encode_image(self, image_input: str) -> np.ndarray:
         """Encode image to CLIP embedding"""
         try:
             if self.model is None:
-                return await self._mock_embedding()
-            
-            # Handle different input types
-            if image_input.startswith('http'):
-                # Download image from URL
-                response = requests.get(image_input)
-                image = Image.open(io.BytesIO(response.content))
-            elif image_input.startswith('data:image'):
-                # Base64 encoded image
-                image_data = image_input.split(',')[1]
-                image = Image.open(io.BytesIO(base64.b64decode(image_data)))
-            else:
-                # Assume it's a file path or bytes
-                if isinstance(image_input, bytes):
-                    image = Image.open(io.BytesIO(image_input))
-                else:
-                    image = Image.open(image_input)
-            
-            # Preprocess image
-            inputs = self.processor(images=image, return_tensors="pt", padding=True)
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
-            
-            # Get image embedding
-            with torch.no_grad():
-                image_features = self.model.get_image_features(**inputs)
-                embedding = image_features.cpu().numpy()[0].tolist()
-            
-            return embedding
+                return self._mock_embedding()
+            
+            return await self._image_batcher.submit(image_input)
             
         except Exception as e:
-            print(f"Error encoding image: {e}")
-            return await self._mock_embedding()
+            logger.warning("Error encoding image: %s", e)
+            return self._mock_embedding()
     
-    async def encode_text(self, text: str) -> List[float]:
-        """Encode text to CLIP embedding"""
+    async def _encode_image_batch(self, image_inputs: List[str]) -> List[Union[np.ndarray, Exception]]:
+        """Encode a micro-batch of encode_image inputs; inputs that fail to load fail alone"""
+        # Decode and forward pass are blocking; keep them off the event loop
+        loop = asyncio.get_running_loop()
+        images = await asyncio.gather(*(
+            loop.run_in_executor(None, self._load_image, image_input)
+            for image_input in image_inputs
+        ), return_exceptions=True)
+        
+        results = list(images)
+        loaded = [i for i, image in enumerate(images) if not isinstance(image, BaseException)]
+        if loaded:
+            embeddings = await loop.run_in_executor(
+                None, self._encode_images_sync, [images[i] for i in loaded]
+            )
+            for i, embedding in zip(loaded, embeddings):
+                results[i] = embedding
+        return results
+    
+    async def encode_images_batch(self, image_inputs: List[str]) -> np.ndarray:
+        """Encode several images to CLIP embeddings in one forward pass"""
         try:
-            if self.model is None:
-                return await self._mock_embedding()
+            if self.model is None or not image_inputs:
+                return np.full((len(image_inputs), 512), 1 / np.sqrt(512), dtype=np.float32)
             
-            # Preprocess text
-            inputs = self.processor(text=text, return_tensors="pt", padding=True)
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            # Fetch and decode all images concurrently, then run one forward pass
+            loop = asyncio.get_running_loop()
+            images = await asyncio.gather(*(
+                loop.run_in_executor(None, self._load_image, image_input)
+                for image_input in image_inputs
+            ))
+            return await loop.run_in_executor(None, self._encode_images_sync, images)
             
-            # Get text embedding
-            with torch.no_grad():
-                text_features = self.model.get_text_features(**inputs)
-                embedding = text_features.cpu().numpy()[0].tolist()
+        except Exception as e:
+            logger.warning("Error encoding image batch: %s", e)
+            return np.full((len(image_inputs), 512), 1 / np.sqrt(512), dtype=np.float32)
+    
+    async def encode_image_regions(self, image_input: Union[bytes, str], bboxes: List[List[int]]) -> np.ndarray:
+        """Encode each bbox [x1, y1, x2, y2] crop of one image, decoding the image only once"""
+        try:
+            if self.model is None or not bboxes:
+                return np.full((len(bboxes), 512), 1 / np.sqrt(512), dtype=np.float32)
+            
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._encode_regions_sync, image_input, bboxes)
+            
+        except Exception as e:
+            logger.warning("Error encoding image regions: %s", e)
+            return np.full((len(bboxes), 512), 1 / np.sqrt(512), dtype=np.float32)
+    
+    def _encode_regions_sync(self, image_input: Union[bytes, str], bboxes: List[List[int]]) -> np.ndarray:
+        """Blocking body of encode_image_regions"""
+        image = self._load_image(image_input)
+        pixels = image if isinstance(image, np.ndarray) else np.asarray(image.convert("RGB"))
+        height, width = pixels.shape[:2]
+        
+        # Crops are views into the decoded array and go to the processor without re-encoding
+        crops = []
+        for x1, y1, x2, y2 in bboxes:
+            x1, y1 = min(max(int(x1), 0), width - 1), min(max(int(y1), 0), height - 1)
+            x2, y2 = max(min(int(x2), width), x1 + 1), max(min(int(y2), height), y1 + 1)
+            crops.append(pixels[y1:y2, x1:x2])
+        return self._encode_images_sync(crops)
+    
+    def _encode_images_sync(self, images: List[Union[np.ndarray, Image.Image]]) -> np.ndarray:
+        """Blocking forward pass of encode_images_batch over decoded images"""
+        # The processor stacks all images into a single batch tensor
+        inputs = self.processor(images=images, return_tensors="pt", padding=True)
+        inputs = self._to_device(inputs)
+        
+        with torch.inference_mode():
+            image_features = self._image_features(inputs["pixel_values"])
+        
+        return self.normalize(image_features.float().cpu().numpy())
+    
+    def _image_features(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """Image features for a pixel batch, padded to warmed-up bucket sizes when compiled"""
+        if not self._compiled:
+            return self.model.get_image_features(pixel_values=pixel_values)
+        
+        features = []
+        for chunk in torch.split(pixel_values, CLIP_MAX_BATCH_SIZE):
+            count = len(chunk)
+            bucket = next(size for size in CLIP_BATCH_BUCKETS if size >= count)
+            if bucket > count:
+                chunk = torch.cat([chunk, chunk.new_zeros((bucket - count, *chunk.shape[1:]))])
+            # Clone: outputs of a reduce-overhead (CUDA graph) call are reused by the next call
+            features.append(self.model.get_image_features(pixel_values=chunk)[:count].clone())
+        return torch.cat(features)
+    
+    def _text_cache_key(self, text: str) -> str:
+        """Redis key for a text embedding, scoped to the loaded CLIP model"""
+        digest = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+        return f"clip:text:{settings.CLIP_MODEL_NAME}:{digest}"
+    
+    def _get_cached_text_embedding(self, key: str) -> Optional[np.ndarray]:
+        """Fetch a cached text embedding, disabling the cache if Redis is unreachable"""
+        if self.redis is None:
+            return None
+        try:
+            cached = self.redis.get(key)
+        except Exception as e:
+            logger.warning("Redis unavailable, disabling text embedding cache: %s", e)
+            self.redis = None
+            return None
+        if cached is None:
+            return None
+        return np.frombuffer(cached, dtype=np.float16).astype(np.float32)
+    
+    def _set_cached_text_embedding(self, key: str, embedding: np.ndarray):
+        """Store a text embedding in Redis as float16 bytes"""
+        if self.redis is None:
+            return
+        try:
+            self.redis.set(
+                key, np.asarray(embedding, dtype=np.float16).tobytes(), ex=TEXT_EMBEDDING_TTL
+            )
+        except Exception as e:
+            logger.warning("Redis unavailable, disabling text embedding cache: %s", e)
+            self.redis = None
+    
+    async def encode_text(self, text: str) -> np.ndarray:
+        """Encode text to CLIP embedding"""
+        try:
+            if self.model is None:
+                return self._mock_embedding()
             
-            return embedding
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._encode_text_sync, text)
             
         except Exception as e:
-            print(f"Error encoding text: {e}")
-            return await self._mock_embedding()
+            logger.warning("Error encoding text: %s", e)
+            return self._mock_embedding()
+    
+    def _encode_text_sync(self, text: str) -> np.ndarray:
+        """Blocking body of encode_text, including the Redis lookup"""
+        cache_key = self._text_cache_key(text)
+        cached = self._get_cached_text_embedding(cache_key)
+        if cached is not None:
+            return cached
+        
+        # Preprocess text
+        # Compiled text features were warmed up at the tokenizer's max length
+        inputs = self.processor(
+            text=text, return_tensors="pt", padding="max_length" if self._compiled else True
+        )
+        inputs = self._to_device(inputs)
+        
+        # Get text embedding
+        with torch.inference_mode():
+            text_features = self.model.get_text_features(**inputs)
+            embedding = self.normalize(text_features.float().cpu().numpy()[0])
+        
+        self._set_cached_text_embedding(cache_key, embedding)
+        return embedding
     
-    async def compute_similarity(
+    def compute_similarity(
         self, 
-        image_embedding: List[float], 
-        text_embedding: List[float]
+        image_embedding: np.ndarray, 
+        text_embedding: np.ndarray
     ) -> float:
         """Compute cosine similarity between image and text embeddings"""
         try:
             if self.model is None:
-                return await self._mock_similarity()
+                return self._mock_similarity()
             
-            # Convert to numpy arrays
-            img_emb = np.array(image_embedding)
-            txt_emb = np.array(text_embedding)
+            img_emb = np.asarray(image_embedding, dtype=np.float32)
+            txt_emb = np.asarray(text_embedding, dtype=np.float32)
             
-            # Normalize embeddings
-            img_emb = img_emb / np.linalg.norm(img_emb)
-            txt_emb = txt_emb / np.linalg.norm(txt_emb)
-            
-            # Compute cosine similarity
-            similarity = np.dot(img_emb, txt_emb)
-            
-            return float(similarity)
+            # Embeddings are pre-normalized, so the dot product is the cosine
+            return float(np.dot(img_emb, txt_emb))
             
         except Exception as e:
-            print(f"Error computing similarity: {e}")
-            return await self._mock_similarity()
+            logger.warning("Error computing similarity: %s", e)
+            return self._mock_similarity()
     
-    async def compute_image_similarity(
+    def compute_image_similarity(
         self, 
-        image_embedding1: List[float], 
-        image_embedding2: List[float]
+        image_embedding1: np.ndarray, 
+        image_embedding2: np.ndarray
     ) -> float:
         """Compute cosine similarity between two image embeddings"""
         try:
             if self.model is None:
-                return await self._mock_similarity()
+                return self._mock_similarity()
             
-            # Convert to numpy arrays
-            emb1 = np.array(image_embedding1)
-            emb2 = np.array(image_embedding2)
+            emb1 = np.asarray(image_embedding1, dtype=np.float32)
+            emb2 = np.asarray(image_embedding2, dtype=np.float32)
             
-            # Normalize embeddings
-            emb1 = emb1 / np.linalg.norm(emb1)
-            emb2 = emb2 / np.linalg.norm(emb2)
+            # Embeddings are pre-normalized, so the dot product is the cosine
+            return float(np.dot(emb1, emb2))
             
-            # Compute cosine similarity
-            similarity = np.dot(emb1, emb2)
+        except Exception as e:
+            logger.warning("Error computing image similarity: %s", e)
+            return self._mock_similarity()
+    
+    def compute_image_similarities(
+        self,
+        image_embedding: np.ndarray,
+        candidate_embeddings: Union[np.ndarray, List[List[float]]]
+    ) -> np.ndarray:
+        """Cosine similarity of one image embedding against every row of an (N, D) matrix"""
+        candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+        try:
+            if self.model is None:
+                return np.full(len(candidates), self._mock_similarity(), dtype=np.float32)
             
-            return float(similarity)
+            # Embeddings are pre-normalized, so one matrix-vector product gives every cosine
+            return candidates @ np.asarray(image_embedding, dtype=np.float32)
             
         except Exception as e:
-            print(f"Error computing image similarity: {e}")
-            return await self._mock_similarity()
+            logger.warning("Error computing image similarities: %s", e)
+            return np.full(len(candidates), self._mock_similarity(), dtype=np.float32)
     
-    async def find_most_similar(
-        self, 
-        query_embedding: List[float], 
-        candidate_embeddings: List[List[float]]
-    ) -> Dict[str, Any]:
-        """Find most similar embedding from candidates"""
+    def compute_quantized_similarities(
+        self,
+        image_embeddings: np.ndarray,
+        candidates: QuantizedEmbeddings
+    ) -> np.ndarray:
+        """Cosine similarity of a (D,) or (G, D) embedding against every int8 candidate row"""
         try:
             if self.model is None:
-                return await self._mock_most_similar()
-            
-            similarities = []
-            for candidate in candidate_embeddings:
-                similarity = await self.compute_image_similarity(
-                    query_embedding, candidate
+                return np.full(
+                    np.shape(image_embeddings)[:-1] + (len(candidates),),
+                    self._mock_similarity(), dtype=np.float32
                 )
-                similarities.append(similarity)
             
-            # Find best match
-            best_idx = np.argmax(similarities)
-            best_similarity = similarities[best_idx]
-            
-            return {
-                "best_index": int(best_idx),
-                "best_similarity": best_similarity,
-                "all_similarities": similarities
-            }
+            return candidates.dot(image_embeddings)
             
         except Exception as e:
-            print(f"Error finding most similar: {e}")
-            return await self._mock_most_similar()
+            logger.warning("Error computing quantized similarities: %s", e)
+            return np.full(
+                np.shape(image_embeddings)[:-1] + (len(candidates),),
+                self._mock_similarity(), dtype=np.float32
+            )
     
-    async def _mock_embedding(self) -> List[float]:
+    def _mock_embedding(self) -> np.ndarray:
         """Mock embedding for development"""
-        return [0.1] * 512  # CLIP embeddings are typically 512-dimensional
+        # CLIP embeddings are typically 512-dimensional; this one is unit length
+        return np.full(512, 1 / np.sqrt(512), dtype=np.float32)
     
-    async def _mock_similarity(self) -> float:
+    def _mock_similarity(self) -> float:
         """Mock similarity for development"""
         return 0.75
-    
-    async def _mock_most_similar(self) -> Dict[str, Any]:
-        """Mock most similar result for development"""
-        return {
-            "best_index": 0,
-            "best_similarity": 0.85,
-            "all_similarities": [0.85, 0.72, 0.68, 0.91, 0.63]
-        }
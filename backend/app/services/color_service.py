@@ -1,9 +1,15 @@
+import asyncio
 import cv2
 import numpy as np
 from typing import List, Dict, Any, Optional
 from PIL import Image
 import io
-import colorsys
+import bisect
+import math
+
+MAX_KMEANS_PIXELS = 4096  # Subsample size for dominant color clustering
+SKIN_ANALYSIS_SIZE = 256  # Longest side used for skin tone detection
+GARMENT_ANALYSIS_SIZE = 128  # Longest side used for garment color clustering
 
 class ColorService:
     """Color and Palette service for skin tone and color harmony analysis"""
@@ -26,6 +32,30 @@ class ColorService:
             # Dark skin tones
             {"hue": (0, 30), "sat": (40, 100), "val": (20, 60)}
         ]
+        
+        # Skin mask bounds (OpenCV HSV), allocated once for cv2.inRange
+        self._skin_lower = np.array([0, 20, 20], dtype=np.uint8)
+        self._skin_upper = np.array([30, 255, 255], dtype=np.uint8)
+        
+        # Base harmony score by hue-difference band, precomputed from the analogous/
+        # complementary/triadic windows in color_harmony_rules. Band i covers
+        # [edge[i-1], edge[i]); the inclusive "<= 30" and "<= 210" upper bounds are
+        # exclusive at the next float up, so every boundary scores exactly as the rules do
+        self._hue_edges = (math.nextafter(30, math.inf), 90, 150, math.nextafter(210, math.inf))
+        self._hue_scores = (
+            0.9,  # Analogous: within 30
+            0.5,
+            0.7,  # Triadic: within 30 of 120
+            0.8,  # Complementary: within 30 of 180
+            0.5
+        )
+        
+        # Seeded generator keeps pixel subsampling reproducible
+        self._rng = np.random.default_rng(42)
+        
+        # Dominant color clustering parameters, built once and reused per garment
+        self._kmeans_clusters = 3
+        self._kmeans_criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
     
     async def analyze_colors(
         self,
@@ -33,24 +63,42 @@ class ColorService:
         segmentation_results: List[Dict[str, Any]]
     ) -> Dict[str, Any]:
         """Analyze colors in the frame and provide harmony feedback"""
+        try:
+            # Decoding, clustering and conversions are CPU-bound; run them off the event loop
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                None, self._analyze_colors_sync, frame, segmentation_results
+            )
+            
+        except Exception as e:
+            print(f"Error in color analysis: {e}")
+            return self._mock_color_analysis()
+    
+    def _analyze_colors_sync(
+        self,
+        frame: bytes,
+        segmentation_results: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Blocking body of analyze_colors"""
         try:
             # Convert frame to PIL Image
-            image = Image.open(io.BytesIO(frame))
+            image = Image.open(io.BytesIO(frame)).convert("RGB")
             image_array = np.array(image)
             
-            # Convert to HSV for better color analysis
-            hsv_image = cv2.cvtColor(image_array, cv2.COLOR_RGB2HSV)
+            # Skin tone only needs a small thumbnail; convert that to HSV
+            small_image = self._downsample(image_array, SKIN_ANALYSIS_SIZE)
+            hsv_small = cv2.cvtColor(small_image, cv2.COLOR_RGB2HSV)
             
             # Analyze skin tone
-            skin_tone = await self._analyze_skin_tone(hsv_image)
+            skin_tone = self._analyze_skin_tone(hsv_small)
             
-            # Analyze garment colors
-            garment_colors = await self._analyze_garment_colors(
-                hsv_image, segmentation_results
+            # Analyze garment colors (regions are cropped from the full-res frame)
+            garment_colors = self._analyze_garment_colors(
+                image_array, segmentation_results
             )
             
             # Analyze color harmony
-            harmony_analysis = await self._analyze_color_harmony(
+            harmony_analysis = self._analyze_color_harmony(
                 skin_tone, garment_colors
             )
             
@@ -63,44 +111,41 @@ class ColorService:
             
         except Exception as e:
             print(f"Error in color analysis: {e}")
-            return await self._mock_color_analysis()
+            return self._mock_color_analysis()
     
-    async def _analyze_skin_tone(self, hsv_image: np.ndarray) -> Dict[str, Any]:
+    def _analyze_skin_tone(self, hsv_image: np.ndarray) -> Dict[str, Any]:
         """Analyze skin tone in the image"""
         try:
             # Create skin tone mask (simplified)
-            lower_skin = np.array([0, 20, 20])
-            upper_skin = np.array([30, 255, 255])
-            skin_mask = cv2.inRange(hsv_image, lower_skin, upper_skin)
+            skin_mask = cv2.inRange(hsv_image, self._skin_lower, self._skin_upper)
             
-            # Find skin regions
-            skin_pixels = hsv_image[skin_mask > 0]
-            
-            if len(skin_pixels) == 0:
+            if cv2.countNonZero(skin_mask) == 0:
                 return {"detected": False, "tone": "unknown"}
             
-            # Calculate average skin tone
-            avg_hue = np.mean(skin_pixels[:, 0])
-            avg_sat = np.mean(skin_pixels[:, 1])
-            avg_val = np.mean(skin_pixels[:, 2])
+            # Average skin tone in one masked reduction, without gathering pixels
+            avg_hue, avg_sat, avg_val, _ = cv2.mean(hsv_image, mask=skin_mask)
             
             # Classify skin tone
             skin_tone = self._classify_skin_tone(avg_hue, avg_sat, avg_val)
             
+            # Same OpenCV HSV -> RGB conversion as the dominant garment colors
+            hsv_pixel = np.clip(np.rint([avg_hue, avg_sat, avg_val]), 0, 255).astype(np.uint8).reshape(1, 1, 3)
+            rgb = cv2.cvtColor(hsv_pixel, cv2.COLOR_HSV2RGB).reshape(3).tolist()
+            
             return {
                 "detected": True,
                 "tone": skin_tone,
                 "hsv": [float(avg_hue), float(avg_sat), float(avg_val)],
-                "rgb": self._hsv_to_rgb(avg_hue, avg_sat, avg_val)
+                "rgb": rgb
             }
             
         except Exception as e:
             print(f"Error analyzing skin tone: {e}")
             return {"detected": False, "tone": "unknown"}
     
-    async def _analyze_garment_colors(
+    def _analyze_garment_colors(
         self,
-        hsv_image: np.ndarray,
+        image_array: np.ndarray,
         segmentation_results: List[Dict[str, Any]]
     ) -> List[Dict[str, Any]]:
         """Analyze colors of detected garments"""
@@ -113,10 +158,18 @@ class ColorService:
                 bbox = seg_result["bbox"]
                 x1, y1, x2, y2 = bbox
                 
-                garment_region = hsv_image[y1:y2, x1:x2]
-                
-                # Calculate dominant colors
-                dominant_colors = self._extract_dominant_colors(garment_region)
+                # Downsample the RGB crop before converting it to HSV
+                garment_region = self._downsample(
+                    image_array[y1:y2, x1:x2], GARMENT_ANALYSIS_SIZE
+                )
+                if garment_region.size:
+                    garment_region = cv2.cvtColor(garment_region, cv2.COLOR_RGB2HSV)
+                    
+                    # Calculate dominant colors
+                    dominant_colors = self._extract_dominant_colors(garment_region)
+                else:
+                    # Degenerate bbox: the garment is still listed, with no colors
+                    dominant_colors = []
                 
                 garment_colors.append({
                     "class": seg_result["class"],
@@ -130,7 +183,7 @@ class ColorService:
         
         return garment_colors
     
-    async def _analyze_color_harmony(
+    def _analyze_color_harmony(
         self,
         skin_tone: Dict[str, Any],
         garment_colors: List[Dict[str, Any]]
@@ -182,29 +235,50 @@ class ColorService:
                 "harmony_type": "neutral"
             }
     
+    def _downsample(self, image: np.ndarray, max_side: int) -> np.ndarray:
+        """Shrink an image so its longest side is at most max_side"""
+        height, width = image.shape[:2]
+        if not height or not width:
+            return image
+        scale = max_side / max(height, width)
+        if scale >= 1:
+            return image
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    
     def _extract_dominant_colors(self, image_region: np.ndarray) -> List[Dict[str, Any]]:
         """Extract dominant colors from image region"""
         try:
             # Reshape image for k-means clustering
-            pixels = image_region.reshape(-1, 3)
+            pixels = image_region.reshape(-1, 3).astype(np.float32)
+            
+            # A random subsample gives statistically the same clusters much faster
+            if pixels.shape[0] > MAX_KMEANS_PIXELS:
+                pixels = pixels[self._rng.choice(pixels.shape[0], MAX_KMEANS_PIXELS, replace=False)]
+            
+            # Use OpenCV's native k-means to find dominant colors
+            _, labels, centers = cv2.kmeans(
+                pixels, self._kmeans_clusters, None, self._kmeans_criteria,
+                1, cv2.KMEANS_PP_CENTERS
+            )
             
-            # Use k-means to find dominant colors
-            from sklearn.cluster import KMeans
+            # Order clusters by size so the first color is the most dominant
+            counts = np.bincount(labels.ravel(), minlength=len(centers))
+            centers = centers[np.argsort(counts)[::-1]]
             
-            kmeans = KMeans(n_clusters=3, random_state=42)
-            kmeans.fit(pixels)
+            # Convert all cluster centers (OpenCV HSV) to RGB in one call
+            hsv_centers = np.clip(np.rint(centers), 0, 255).astype(np.uint8).reshape(1, -1, 3)
+            rgb_centers = cv2.cvtColor(hsv_centers, cv2.COLOR_HSV2RGB).reshape(-1, 3).tolist()
             
             # Get cluster centers (dominant colors)
-            dominant_colors = []
-            for center in kmeans.cluster_centers_:
-                h, s, v = center
-                rgb = self._hsv_to_rgb(h, s, v)
-                
-                dominant_colors.append({
+            dominant_colors = [
+                {
                     "hsv": [float(h), float(s), float(v)],
                     "rgb": rgb,
-                    "hex": self._rgb_to_hex(rgb)
-                })
+                    "hex": f"#{rgb[0]:02x}{rgb[1]:02x}{rgb[2]:02x}"
+                }
+                for (h, s, v), rgb in zip(centers, rgb_centers)
+            ]
             
             return dominant_colors
             
@@ -231,15 +305,8 @@ class ColorService:
             sat_diff = abs(s1 - s2) / 255.0
             val_diff = abs(v1 - v2) / 255.0
             
-            # Score based on harmony rules
-            if hue_diff <= 30:  # Analogous
-                harmony_score = 0.9
-            elif abs(hue_diff - 180) <= 30:  # Complementary
-                harmony_score = 0.8
-            elif abs(hue_diff - 120) <= 30:  # Triadic
-                harmony_score = 0.7
-            else:
-                harmony_score = 0.5
+            # Score based on harmony rules (table lookup instead of branches)
+            harmony_score = self._hue_scores[bisect.bisect_right(self._hue_edges, hue_diff)]
             
             # Adjust for saturation and value harmony
             if sat_diff < 0.3 and val_diff < 0.3:
@@ -287,19 +354,7 @@ class ColorService:
         else:
             return f"Consider a different color for the {garment_class} to better complement your {skin_tone} skin tone"
     
-    def _hsv_to_rgb(self, h: float, s: float, v: float) -> List[int]:
-        """Convert HSV to RGB"""
-        try:
-            rgb = colorsys.hsv_to_rgb(h/360, s/255, v/255)
-            return [int(c * 255) for c in rgb]
-        except:
-            return [0, 0, 0]
-    
-    def _rgb_to_hex(self, rgb: List[int]) -> str:
-        """Convert RGB to hex"""
-        return f"#{rgb[0]:02x}{rgb[1]:02x}{rgb[2]:02x}"
-    
-    async def _mock_color_analysis(self) -> Dict[str, Any]:
+    def _mock_color_analysis(self) -> Dict[str, Any]:
         """Mock color analysis for development"""
         return {
             "skin_tone": {
@@ -1,11 +1,80 @@
-import openai
-import base64
+import asyncio
+import logging
 import json
-from typing import List, Dict, Any, Optional
-from PIL import Image
-import io
+from typing import List, Dict, Any, Optional, Tuple, Union
 
 from app.core.config import settings
+from app.schemas.analysis import Feedback
+from app.services.openai_pool import get_openai_client, create_chat_completion
+from app.services.openai_client import prep_frame
+from app.services.response_cache import CacheKey, ResponseCache
+
+logger = logging.getLogger(__name__)
+
+# Parses the JSON object embedded in a response in a single pass
+_DECODER = json.JSONDecoder()
+
+# Accepted values for model-provided feedback fields; anything else falls back to a default
+FEEDBACK_TYPES = frozenset(["proportion", "color", "style", "fit", "general"])
+FEEDBACK_PRIORITIES = frozenset(["high", "medium", "low"])
+
+GPT_MAX_CONCURRENCY = 8  # In-flight requests per analyze_fashion_multi call, to respect rate limits
+
+# Static prompt and mock feedback, built once at import instead of per call
+SYSTEM_PROMPT = """You are a professional fashion stylist and image analyst. Your task is to analyze fashion images and provide constructive, actionable feedback.
+
+Focus on:
+1. **Proportions**: How well the clothing fits the person's body type
+2. **Color Harmony**: How well colors work together and with skin tone
+3. **Style Coherence**: How well the outfit works as a whole
+4. **Fit Quality**: Whether the clothing fits properly
+5. **Occasion Appropriateness**: Whether the outfit is suitable for the intended occasion
+
+Provide feedback in this JSON format:
+{
+  "feedback": [
+    {
+      "type": "proportion|color|style|fit|general",
+      "message": "Clear, actionable feedback message",
+      "confidence": 0.85,
+      "priority": "high|medium|low",
+      "actionable": true
+    }
+  ]
+}
+
+Be constructive, specific, and helpful. Focus on actionable improvements."""
+
+MOCK_FEEDBACK = [
+    Feedback(
+        type="proportion",
+        message="The shirt fits well with your body proportions. The shoulder seams align properly with your shoulders.",
+        confidence=0.88,
+        priority="medium",
+        actionable=True
+    ),
+    Feedback(
+        type="color",
+        message="The blue tones in your outfit complement your skin tone nicely. Consider adding a contrasting accessory for more visual interest.",
+        confidence=0.82,
+        priority="low",
+        actionable=True
+    ),
+    Feedback(
+        type="style",
+        message="This is a well-coordinated casual outfit. The combination of shirt and pants creates a balanced, relaxed look.",
+        confidence=0.90,
+        priority="medium",
+        actionable=False
+    ),
+    Feedback(
+        type="fit",
+        message="The pants could be slightly more fitted around the waist for a more polished appearance.",
+        confidence=0.75,
+        priority="high",
+        actionable=True
+    )
+]
 
 class GPTService:
     """GPT-4o Vision service for high-level fashion analysis"""
@@ -13,58 +82,105 @@ class GPTService:
     def __init__(self):
         self.client = None
         self.model = "gpt-4o"
+        self.response_cache = ResponseCache(maxsize=4096, ttl=3600)
+        # Exact cache key -> feedback future of the request currently analyzing that frame
+        self._inflight: Dict[str, asyncio.Future] = {}
     
     async def load_model(self):
         """Initialize OpenAI client"""
         try:
-            print("Initializing GPT-4o service...")
-            self.client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-            print("GPT-4o service initialized successfully")
-        except Exception as e:
-            print(f"Error initializing GPT-4o service: {e}")
+            logger.info("Initializing GPT-4o service...")
+            self.client = get_openai_client()
+            logger.info("GPT-4o service initialized successfully")
+        except Exception:
+            logger.exception("Error initializing GPT-4o service")
             self.client = None
     
     async def analyze_fashion(
         self,
-        frame: bytes,
+        frame: Union[bytes, memoryview],
         detections: List[Dict[str, Any]],
         segmentation_results: List[Dict[str, Any]],
         user_prefs: Optional[Dict[str, Any]] = None
-    ) -> List[Dict[str, Any]]:
+    ) -> List[Feedback]:
         """Analyze fashion using GPT-4o Vision"""
         try:
             if self.client is None:
                 return await self._mock_fashion_analysis()
             
-            # Convert frame to base64
-            frame_b64 = base64.b64encode(frame).decode('utf-8')
-            
-            # Prepare context from detections
+            # Prepare detection and user preferences context
             context = self._prepare_detection_context(detections, segmentation_results)
-            
-            # Prepare user preferences context
             prefs_context = self._prepare_preferences_context(user_prefs)
             
-            # Create system prompt
-            system_prompt = self._create_system_prompt()
-            
-            # Create user message
-            user_message = self._create_user_message(context, prefs_context)
-            
-            # Call GPT-4o Vision
-            response = await self._call_gpt_vision(
-                frame_b64, system_prompt, user_message
+            # Serve repeated and near-identical frames from the response cache; hashing runs off the event loop
+            cache_key, cached = await asyncio.to_thread(
+                self._lookup_response, frame, f"{context}|{prefs_context}"
             )
+            if cached is not None:
+                return list(cached)
             
-            # Parse response
-            feedback = self._parse_gpt_response(response)
+            # Coalesce identical in-flight requests onto the first caller's result
+            inflight = self._inflight.get(cache_key.exact)
+            if inflight is not None:
+                return list(await asyncio.shield(inflight))
+            
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[cache_key.exact] = future
+            try:
+                # Only the leading request pays for the downscale and re-encode
+                frame_b64 = await asyncio.to_thread(prep_frame, frame)
+                
+                # Create system prompt
+                system_prompt = self._create_system_prompt()
+                
+                # Create user message
+                user_message = self._create_user_message(context, prefs_context)
+                
+                # Call GPT-4o Vision
+                response = await self._call_gpt_vision(
+                    frame_b64, system_prompt, user_message
+                )
+                
+                # Parse response
+                feedback = self._parse_gpt_response(response)
+                await asyncio.to_thread(self.response_cache.set, cache_key, feedback)
+                future.set_result(feedback)
+            finally:
+                del self._inflight[cache_key.exact]
+                if not future.done():
+                    # The leading request failed or was cancelled; waiters fall back like it does
+                    future.set_result(self._create_mock_feedback())
             
-            return feedback
+            return list(feedback)
             
-        except Exception as e:
-            print(f"Error in GPT fashion analysis: {e}")
+        except Exception:
+            logger.exception("Error in GPT fashion analysis")
             return await self._mock_fashion_analysis()
     
+    async def analyze_fashion_multi(
+        self,
+        frames: List[bytes],
+        detections: List[List[Dict[str, Any]]],
+        segmentation_results: List[List[Dict[str, Any]]],
+        user_prefs: Optional[Dict[str, Any]] = None
+    ) -> List[List[Feedback]]:
+        """Analyze several frames in parallel, at most GPT_MAX_CONCURRENCY at a time"""
+        semaphore = asyncio.Semaphore(GPT_MAX_CONCURRENCY)
+        
+        async def analyze_one(frame, frame_detections, frame_segments):
+            async with semaphore:
+                return await self.analyze_fashion(frame, frame_detections, frame_segments, user_prefs)
+        
+        return await asyncio.gather(*[
+            analyze_one(frame, frame_detections, frame_segments)
+            for frame, frame_detections, frame_segments in zip(frames, detections, segmentation_results)
+        ])
+    
+    def _lookup_response(self, frame: Union[bytes, memoryview], params: str) -> Tuple[CacheKey, Optional[List[Feedback]]]:
+        """Hash the frame and look up a cached response (CPU-bound)"""
+        key = self.response_cache.key(frame, params)
+        return key, self.response_cache.get(key)
+    
     def _prepare_detection_context(
         self, 
         detections: List[Dict[str, Any]], 
@@ -116,29 +232,7 @@ class GPTService:
     
     def _create_system_prompt(self) -> str:
         """Create system prompt for fashion analysis"""
-        return """You are a professional fashion stylist and image analyst. Your task is to analyze fashion images and provide constructive, actionable feedback.
-
-Focus on:
-1. **Proportions**: How well the clothing fits the person's body type
-2. **Color Harmony**: How well colors work together and with skin tone
-3. **Style Coherence**: How well the outfit works as a whole
-4. **Fit Quality**: Whether the clothing fits properly
-5. **Occasion Appropriateness**: Whether the outfit is suitable for the intended occasion
-
-Provide feedback in this JSON format:
-{
-  "feedback": [
-    {
-      "type": "proportion|color|style|fit|general",
-      "message": "Clear, actionable feedback message",
-      "confidence": 0.85,
-      "priority": "high|medium|low",
-      "actionable": true
-    }
-  ]
-}
-
-Be constructive, specific, and helpful. Focus on actionable improvements."""
+        return SYSTEM_PROMPT
     
     def _create_user_message(self, detection_context: str, prefs_context: str) -> str:
         """Create user message for GPT analysis"""
@@ -158,7 +252,7 @@ Analyze the outfit and provide feedback in the specified JSON format."""
     ) -> str:
         """Call GPT-4o Vision API"""
         try:
-            response = self.client.chat.completions.create(
+            response = await create_chat_completion(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -176,76 +270,63 @@ Analyze the outfit and provide feedback in the specified JSON format."""
                     }
                 ],
                 max_tokens=1000,
-                temperature=0.7
+                temperature=0.7,
+                response_format={"type": "json_object"}
             )
             
             return response.choices[0].message.content
             
         except Exception as e:
-            print(f"Error calling GPT-4o Vision: {e}")
+            logger.error("Error calling GPT-4o Vision: %s", e)
             raise
     
-    def _parse_gpt_response(self, response: str) -> List[Dict[str, Any]]:
+    def _parse_gpt_response(self, response: str) -> List[Feedback]:
         """Parse GPT response into feedback format"""
+        # The first "{" also skips any ```json fence; raw_decode stops at the end of the object
+        json_start = response.find("{")
+        if json_start < 0:
+            # Fallback to mock response
+            return self._create_mock_feedback()
+        
         try:
-            # Try to extract JSON from response
-            if "```json" in response:
-                json_start = response.find("```json") + 7
-                json_end = response.find("```", json_start)
-                json_str = response[json_start:json_end].strip()
-            elif "{" in response and "}" in response:
-                json_start = response.find("{")
-                json_end = response.rfind("}") + 1
-                json_str = response[json_start:json_end]
-            else:
-                # Fallback to mock response
-                return self._create_mock_feedback()
-            
-            # Parse JSON
-            data = json.loads(json_str)
+            data, _ = _DECODER.raw_decode(response, json_start)
             
-            if "feedback" in data and isinstance(data["feedback"], list):
-                return data["feedback"]
+            if isinstance(data, dict) and isinstance(data.get("feedback"), list):
+                parsed = (self._parse_feedback_item(item) for item in data["feedback"])
+                return [item for item in parsed if item is not None]
             else:
                 return self._create_mock_feedback()
                 
         except Exception as e:
-            print(f"Error parsing GPT response: {e}")
+            logger.warning("Error parsing GPT response: %s", e)
             return self._create_mock_feedback()
     
-    async def _mock_fashion_analysis(self) -> List[Dict[str, Any]]:
+    def _parse_feedback_item(self, item: Any) -> Optional[Feedback]:
+        """Feedback from one model-provided object with defaults for missing fields, None if unusable"""
+        if not isinstance(item, dict):
+            return None
+        message = item.get("message")
+        if not isinstance(message, str) or not message.strip():
+            return None
+        
+        # Only strings are looked up, so unhashable values cannot raise
+        feedback_type, priority = item.get("type"), item.get("priority")
+        confidence = item.get("confidence")
+        if isinstance(confidence, bool) or not isinstance(confidence, (int, float)):
+            confidence = 0.8
+        actionable = item.get("actionable")
+        return Feedback(
+            type=feedback_type if isinstance(feedback_type, str) and feedback_type in FEEDBACK_TYPES else "general",
+            message=message.strip(),
+            confidence=min(max(float(confidence), 0.0), 1.0),
+            priority=priority if isinstance(priority, str) and priority in FEEDBACK_PRIORITIES else "medium",
+            actionable=actionable if isinstance(actionable, bool) else True
+        )
+    
+    async def _mock_fashion_analysis(self) -> List[Feedback]:
         """Mock fashion analysis for development"""
         return self._create_mock_feedback()
     
-    def _create_mock_feedback(self) -> List[Dict[str, Any]]:
+    def _create_mock_feedback(self) -> List[Feedback]:
         """Create mock feedback for development"""
-        return [
-            {
-                "type": "proportion",
-                "message": "The shirt fits well with your body proportions. The shoulder seams align properly with your shoulders.",
-                "confidence": 0.88,
-                "priority": "medium",
-                "actionable": True
-            },
-            {
-                "type": "color",
-                "message": "The blue tones in your outfit complement your skin tone nicely. Consider adding a contrasting accessory for more visual interest.",
-                "confidence": 0.82,
-                "priority": "low",
-                "actionable": True
-            },
-            {
-                "type": "style",
-                "message": "This is a well-coordinated casual outfit. The combination of shirt and pants creates a balanced, relaxed look.",
-                "confidence": 0.90,
-                "priority": "medium",
-                "actionable": False
-            },
-            {
-                "type": "fit",
-                "message": "The pants could be slightly more fitted around the waist for a more polished appearance.",
-                "confidence": 0.75,
-                "priority": "high",
-                "actionable": True
-            }
-        ]
+        return list(MOCK_FEEDBACK)
@@ -1,61 +1,180 @@
 import os
+import re
 import json
-from typing import Optional, Dict, Any
-from openai import OpenAI
+import logging
+import functools
+import hashlib
+import orjson
+import asyncio
+import io
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator, Union
+from cachetools import LRUCache
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", "your_openai_api_key_here"))
+from app.schemas.analysis import Feedback
+from app.services.openai_pool import create_chat_completion
+from app.services.response_cache import CacheKey, ResponseCache
 
-def analyze_frame_b64(mode: str, frame_b64: str, season: str = "summer", style_profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+logger = logging.getLogger(__name__)
+
+# SIMD-accelerated base64 for large frame payloads
+try:
+    import pybase64 as base64
+    PYBASE64_AVAILABLE = True
+except ImportError:
+    import base64
+    PYBASE64_AVAILABLE = False
+    logger.info("pybase64 not available - using stdlib base64")
+
+OPENAI_REQUEST_TIMEOUT = 20  # Seconds allowed for a single vision request
+MAX_FRAME_SIDE = 768  # "detail": "low" only looks at a 512px tile; larger frames are wasted upload
+FRAME_JPEG_QUALITY = 80
+
+# Responses for identical or near-identical frames with the same prompt parameters
+_response_cache = ResponseCache(maxsize=4096, ttl=3600)
+
+# Exact cache key -> result future of the request currently analyzing that frame
+_inflight: Dict[str, asyncio.Future] = {}
+
+# (season, profile id) -> style-mode system prompt with the profile embedded. Profiles
+# can carry several MB of image data URLs, so the bound is on total prompt characters
+PROFILE_PROMPT_CACHE_CHARS = 32 * 1024 * 1024
+_PROFILE_PROMPT_CACHE = LRUCache(maxsize=PROFILE_PROMPT_CACHE_CHARS, getsizeof=len)
+
+def _profile_id(style_profile: Optional[Dict[str, Any]]) -> Optional[str]:
     """
-    Analyzes a single base64 encoded frame using OpenAI's GPT-4o Vision model.
-    Returns structured JSON output for fashion feedback and overlay data.
+    Short stable id for a style profile, None if there is none. Uses the profile's own
+    style_id when it has one; otherwise hashes the whole profile (CPU-bound for
+    profiles with inline images, so call it off the event loop)
+    """
+    if not style_profile:
+        return None
+    style_id = style_profile.get("style_id")
+    if isinstance(style_id, str) and style_id:
+        return style_id
+    return hashlib.blake2b(orjson.dumps(style_profile, option=orjson.OPT_SORT_KEYS), digest_size=8).hexdigest()
+
+def _cache_params(mode: str, season: str, profile_id: Optional[str]) -> str:
+    """Stable string identifying the prompt parameters of a request"""
+    return f"{mode}:{season}:{profile_id or 'none'}"
+
+def _b64encode_str(data: Union[bytes, memoryview]) -> str:
+    """Base64-encode straight to str, skipping the intermediate bytes copy when pybase64 is present"""
+    if PYBASE64_AVAILABLE:
+        return base64.b64encode_as_string(data)
+    return base64.b64encode(data).decode('ascii')
+
+def prep_frame(frame: Union[bytes, memoryview]) -> str:
+    """
+    Downscale a frame to MAX_FRAME_SIDE, re-encode as JPEG and return it base64 encoded.
+    Accepts a memoryview so callers can pass request buffers without copying them.
     """
     try:
-        # Check if OpenAI API key is set
-        api_key = os.getenv('OPENAI_API_KEY', 'your_openai_api_key_here')
-        if api_key == 'your_openai_api_key_here':
-            # Return mock response for testing
-            print("OpenAI API key not set - returning mock response")
-            return {
-                "feedback": [
-                    {
-                        "type": "overall",
-                        "message": "This is a mock analysis response. Set your OpenAI API key for real analysis.",
-                        "confidence": 0.8,
-                        "priority": "medium",
-                        "actionable": True
-                    },
-                    {
-                        "type": "style",
-                        "message": "Your outfit shows good style coordination. Consider adding accessories for a complete look.",
-                        "confidence": 0.75,
-                        "priority": "low",
-                        "actionable": True
-                    }
-                ],
-                "overlay_data": {
-                    "bounding_boxes": [],
-                    "keypoints": [],
-                    "segmentation_masks": [],
-                    "guide_lines": [],
-                    "color_analysis": {
-                        "skin_tone": "neutral",
-                        "dominant_colors": ["blue", "black"],
-                        "color_harmony": "good",
-                        "color_contrast": "medium",
-                        "seasonal_analysis": "autumn"
-                    }
-                },
-                "confidence_score": 0.8
-            }
+        # PIL is imported lazily to keep it out of worker startup
+        from PIL import Image
+        
+        img = Image.open(io.BytesIO(frame))
+        if max(img.size) > MAX_FRAME_SIDE:
+            img.draft("RGB", (MAX_FRAME_SIDE, MAX_FRAME_SIDE))  # Cheap DCT-domain downscale for JPEGs
+            img.thumbnail((MAX_FRAME_SIDE, MAX_FRAME_SIDE), Image.Resampling.LANCZOS)
+            buf = io.BytesIO()
+            img.convert("RGB").save(buf, "JPEG", quality=FRAME_JPEG_QUALITY, optimize=True)
+            frame = buf.getvalue()
+    except Exception as e:
+        logger.warning("Error downscaling frame, sending original: %s", e)
+    return _b64encode_str(frame)
 
-        # Prepare the prompt based on mode
-        if mode == "general":
-            system_prompt = f"""You are TailorAI, a casual, friendly fashion advisor for users aged 18–35 who care about style and self-expression.  
-Your goal: give concise, useful, real-world outfit feedback that feels like advice from a stylish friend — not a fashion textbook.
+def _lookup_response(frame: Union[bytes, memoryview], mode: str, season: str, style_profile: Optional[Dict[str, Any]]) -> Tuple[CacheKey, Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Hash the frame and style profile and look up a cached response (CPU-bound); the
+    frame is only prepped later, by the request that actually calls the API
+    """
+    profile_id = _profile_id(style_profile)
+    key = _response_cache.key(frame, _cache_params(mode, season, profile_id))
+    return key, _response_cache.get(key), profile_id
+
+# Shared, read-only response parts: only the top-level envelope is built per call,
+# since callers add fields such as frame_count to it
+_EMPTY_OVERLAY = {
+    "bounding_boxes": [],
+    "keypoints": [],
+    "segmentation_masks": [],
+    "guide_lines": [],
+    "color_analysis": {
+        "skin_tone": "unknown",
+        "dominant_colors": [],
+        "color_harmony": "fair",
+        "color_contrast": "medium",
+        "seasonal_analysis": "unknown"
+    }
+}
+
+_MOCK_OVERLAY = {
+    "bounding_boxes": [],
+    "keypoints": [],
+    "segmentation_masks": [],
+    "guide_lines": [],
+    "color_analysis": {
+        "skin_tone": "neutral",
+        "dominant_colors": ["blue", "black"],
+        "color_harmony": "good",
+        "color_contrast": "medium",
+        "seasonal_analysis": "autumn"
+    }
+}
+
+_MOCK_FEEDBACK = (
+    Feedback(
+        type="overall",
+        message="This is a mock analysis response. Set your OpenAI API key for real analysis.",
+        confidence=0.8,
+        priority="medium",
+        actionable=True
+    ),
+    Feedback(
+        type="style",
+        message="Your outfit shows good style coordination. Consider adding accessories for a complete look.",
+        confidence=0.75,
+        priority="low",
+        actionable=True
+    )
+)
+
+_FALLBACK_FEEDBACK = Feedback(
+    type="overall",
+    message="Analysis completed. Check the response for detailed feedback.",
+    confidence=0.8,
+    priority="medium",
+    actionable=False
+)
+
+def _create_mock_response() -> Dict[str, Any]:
+    """Mock analysis response used when no OpenAI API key is configured"""
+    return {
+        "feedback": list(_MOCK_FEEDBACK),
+        "overlay_data": _MOCK_OVERLAY,
+        "confidence_score": 0.8
+    }
+
+def _create_error_response(message: str) -> Dict[str, Any]:
+    """Low-confidence response carrying a single user-facing error message"""
+    return {
+        "feedback": [
+            Feedback(
+                type="overall",
+                message=message,
+                confidence=0.3,
+                priority="medium",
+                actionable=True
+            )
+        ],
+        "overlay_data": _EMPTY_OVERLAY,
+        "confidence_score": 0.3
+    }
 
-**Current Season: {season.title()}** - Consider this when making recommendations. Don't suggest heavy layers in summer or light fabrics in winter.
+# Invariant instructions come first and the season last, so every call for a mode
+# shares the same prompt prefix (eligible for OpenAI's server-side prompt caching)
+_GENERAL_SYSTEM_PROMPT = """You are TailorAI, a casual, friendly fashion advisor for users aged 18–35 who care about style and self-expression.  
+Your goal: give concise, useful, real-world outfit feedback that feels like advice from a stylish friend — not a fashion textbook.
 
 Tone & Style Rules:
 - Casual, friendly, and conversational.
@@ -65,37 +184,30 @@ Tone & Style Rules:
 - Be specific: mention colors, fit, and style choices directly.
 - Reference skin tone and undertones when relevant for color advice.
 - If something looks great, say why in simple terms.
-- **Season-appropriate suggestions only** - consider the current season ({season}) when recommending layers, fabrics, or accessories.
+- **Season-appropriate suggestions only** - consider the current season when recommending layers, fabrics, or accessories.
 
 Output Format:
-Always return exactly 5 short sections in this order:
-1. Top/Shirt: [Max 20 words, 1 useful tip or praise]
-2. Bottom/Pants: [Max 20 words, 1 useful tip or praise]
-3. Footwear: [Max 20 words, 1 useful tip or praise]
-4. Accessories: [Max 20 words, tip or idea — if none present, suggest one]
-5. Overall Outfit: [Max 30 words, general vibe + color analysis + improvement idea]
+Always return a JSON object with exactly 5 feedback items in this order:
+{"feedback": [
+  {"type": "top", "message": "Max 20 words, 1 useful tip or praise", "priority": "high|medium|low"},
+  {"type": "bottom", "message": "Max 20 words, 1 useful tip or praise", "priority": "high|medium|low"},
+  {"type": "footwear", "message": "Max 20 words, 1 useful tip or praise", "priority": "high|medium|low"},
+  {"type": "accessories", "message": "Max 20 words, tip or idea — if none present, suggest one", "priority": "high|medium|low"},
+  {"type": "overall", "message": "Max 30 words, general vibe + color analysis + improvement idea", "priority": "high|medium|low"}
+], "confidence_score": 0.8}
 
 Rules:
-- No scores or percentages.
+- No scores or percentages in messages; confidence_score is how sure you are of the feedback, from 0 to 1.
 - No repeating points.
-- One tip per section.
+- One tip per feedback item.
 - Mention undertones, contrast, or color harmony in Overall Outfit if relevant.
 - **Season-appropriate recommendations only** - no heavy jackets in summer, no light fabrics in winter.
 
-Output **only** the 5 sections, no additional text or formatting."""
-            
-            user_prompt = f"Analyze this outfit for {season} and give friendly, actionable feedback."
+Output **only** the JSON object, no additional text or formatting."""
 
-        else:  # style mode
-            style_info = ""
-            if style_profile:
-                style_info = f"\nReference Style Profile: {json.dumps(style_profile, indent=2)}"
-            
-            system_prompt = f"""You are TailorAI, a casual, friendly fashion advisor for users aged 18–35 who want their outfit to match a specific style reference or aesthetic.  
+_STYLE_SYSTEM_PROMPT = """You are TailorAI, a casual, friendly fashion advisor for users aged 18–35 who want their outfit to match a specific style reference or aesthetic.  
 Your goal: give short, targeted feedback on how closely the outfit matches the reference, and what to tweak to get closer.
 
-**Current Season: {season.title()}** - Consider this when making recommendations. Don't suggest heavy layers in summer or light fabrics in winter.
-
 Tone & Style Rules:
 - Casual, friendly, and conversational.
 - Avoid jargon — speak like a stylish friend giving advice.
@@ -103,231 +215,454 @@ Tone & Style Rules:
 - Keep each point focused on moving closer to the target style.
 - Reference skin tone and undertones when relevant for color advice.
 - Be specific about the differences between the current outfit and the reference.
-- **Season-appropriate suggestions only** - consider the current season ({season}) when recommending changes.
+- **Season-appropriate suggestions only** - consider the current season when recommending changes.
 
 Output Format:
-Always return exactly 5 short sections in this order:
-1. Top/Shirt: [Max 20 words, tweak or praise relevant to matching style]
-2. Bottom/Pants: [Max 20 words, tweak or praise relevant to matching style]
-3. Footwear: [Max 20 words, tweak or praise relevant to matching style]
-4. Accessories: [Max 20 words, suggest accessories that match style — or praise existing ones]
-5. Overall Outfit: [Max 30 words, quick verdict on match + 1 improvement tip for color/fabric/vibe]
+Always return a JSON object with exactly 5 feedback items in this order:
+{"feedback": [
+  {"type": "top", "message": "Max 20 words, tweak or praise relevant to matching style", "priority": "high|medium|low"},
+  {"type": "bottom", "message": "Max 20 words, tweak or praise relevant to matching style", "priority": "high|medium|low"},
+  {"type": "footwear", "message": "Max 20 words, tweak or praise relevant to matching style", "priority": "high|medium|low"},
+  {"type": "accessories", "message": "Max 20 words, suggest accessories that match style — or praise existing ones", "priority": "high|medium|low"},
+  {"type": "overall", "message": "Max 30 words, quick verdict on match + 1 improvement tip for color/fabric/vibe", "priority": "high|medium|low"}
+], "confidence_score": 0.8}
 
 Rules:
-- No scores or percentages.
+- No scores or percentages in messages; confidence_score is how sure you are of the feedback, from 0 to 1.
 - No repeating points.
-- One tip per section.
+- One tip per feedback item.
 - If major style gaps exist, highlight them simply (e.g., "needs softer fabrics").
 - **Season-appropriate recommendations only** - no heavy jackets in summer, no light fabrics in winter.
 
-Output **only** the 5 sections, no additional text or formatting."""
-            
-            user_prompt = f"Compare this outfit to the reference style for {season} and give targeted feedback.{style_info}"
+Output **only** the JSON object, no additional text or formatting."""
+
+@functools.lru_cache(maxsize=16)
+def _build_system_prompt(mode: str, season: str) -> str:
+    """System prompt for a mode, with the variable season block at the tail"""
+    base_prompt = _GENERAL_SYSTEM_PROMPT if mode == "general" else _STYLE_SYSTEM_PROMPT
+    return f"""{base_prompt}
+
+**Current Season: {season.title()}** - Consider this when making recommendations. Don't suggest heavy layers in summer or light fabrics in winter."""
+
+def _build_profile_system_prompt(season: str, profile_id: str, style_profile: Dict[str, Any]) -> str:
+    """
+    Style-mode system prompt with the reference profile embedded, built once per profile.
+    The profile comes after the shared instructions and season, so repeat calls for the same
+    profile send an identical prompt that OpenAI's prefix cache can match.
+    """
+    cache_key = (season, profile_id)
+    system_prompt = _PROFILE_PROMPT_CACHE.get(cache_key)
+    if system_prompt is None:
+        profile_json = orjson.dumps(style_profile, option=orjson.OPT_INDENT_2).decode()
+        system_prompt = f"""{_build_system_prompt("style", season)}
+
+Reference Style Profile (id {profile_id}):
+{profile_json}"""
+        if len(system_prompt) <= _PROFILE_PROMPT_CACHE.maxsize:
+            _PROFILE_PROMPT_CACHE[cache_key] = system_prompt
+    return system_prompt
+
+def _create_prompts(mode: str, season: str, style_profile: Optional[Dict[str, Any]] = None, profile_id: Optional[str] = None) -> Tuple[str, str]:
+    """Build the (system, user) prompt pair for a single-frame analysis"""
+    mode = "general" if mode == "general" else "style"
+    
+    if mode == "general":
+        system_prompt = _build_system_prompt(mode, season)
+        user_prompt = f"Analyze this outfit for {season} and give friendly, actionable feedback."
+    else:  # style mode
+        profile_id = profile_id or _profile_id(style_profile)
+        if profile_id:
+            system_prompt = _build_profile_system_prompt(season, profile_id, style_profile)
+        else:
+            system_prompt = _build_system_prompt(mode, season)
+        user_prompt = f"Compare this outfit to the reference style for {season} and give targeted feedback."
+    
+    return system_prompt, user_prompt
+
+async def analyze_frame_b64(mode: str, frame_b64: str, season: str = "summer", style_profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Analyzes a single base64 encoded frame using OpenAI's GPT-4o Vision model.
+    Returns structured JSON output for fashion feedback and overlay data.
+    """
+    try:
+        frame = await asyncio.to_thread(base64.b64decode, frame_b64)
+    except Exception:
+        logger.exception("General error")
+        return _create_error_response("Analysis failed. Please try again.")
+    return await analyze_frame_bytes(mode, frame, season, style_profile)
+
+async def _request_analysis(mode: str, season: str, style_profile: Optional[Dict[str, Any]], profile_id: Optional[str], frame_b64: str, cache_key: CacheKey) -> Dict[str, Any]:
+    """Run one GPT-4o analysis for a prepared frame, caching successful results"""
+    # Prepare the prompt based on mode
+    system_prompt, user_prompt = _create_prompts(mode, season, style_profile, profile_id)
+
+    try:
+        # Call OpenAI Vision API with optimized settings
+        response = await asyncio.wait_for(create_chat_completion(
+            model="gpt-4o",
+            messages=[
+                {
+                    "role": "system",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": user_prompt
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:image/jpeg;base64,{frame_b64}",
+                                "detail": "low" # Use low detail for faster processing
+                            }
+                        }
+                    ]
+                }
+            ],
+            max_tokens=1200,  # Increased for detailed JSON
+            temperature=0.25,  # Balanced for focused but varied responses
+            top_p=0.9,
+            response_format={"type": "json_object"}
+        ), timeout=OPENAI_REQUEST_TIMEOUT)
+
+        # JSON mode guarantees a parseable object; map it to frontend format
+        result = convert_json_response_to_frontend_format(response.choices[0].message.content)
+        await asyncio.to_thread(_response_cache.set, cache_key, result)
+        return result
+
+    except Exception as e:
+        logger.error("OpenAI API error: %s", e)
+
+        # Check if it's a quota error
+        if "quota" in str(e).lower() or "429" in str(e):
+            error_message = "OpenAI quota exceeded. Please check your billing or try again later."
+        else:
+            error_message = "Analysis service temporarily unavailable. Please try again later."
+
+        return _create_error_response(error_message)
+
+async def analyze_frame_bytes(mode: str, frame: Union[bytes, memoryview], season: str = "summer", style_profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Analyzes a single raw image frame using OpenAI's GPT-4o Vision model.
+    The frame is downscaled and re-encoded before upload.
+    """
+    try:
+        # Check if OpenAI API key is set
+        api_key = os.getenv('OPENAI_API_KEY', 'your_openai_api_key_here')
+        if api_key == 'your_openai_api_key_here':
+            # Return mock response for testing
+            logger.warning("OpenAI API key not set - returning mock response")
+            return _create_mock_response()
+
+        # Serve repeated and near-identical frames from the response cache
+        cache_key, cached, profile_id = await asyncio.to_thread(
+            _lookup_response, frame, mode, season, style_profile
+        )
+        if cached is not None:
+            return dict(cached)
+
+        # Coalesce identical in-flight requests onto the first caller's result,
+        # before any of them pays for the frame downscale
+        inflight = _inflight.get(cache_key.exact)
+        if inflight is not None:
+            return dict(await asyncio.shield(inflight))
         
+        future = asyncio.get_running_loop().create_future()
+        _inflight[cache_key.exact] = future
         try:
-            # Call OpenAI Vision API with optimized settings
-            response = client.chat.completions.create(
+            frame_b64 = await asyncio.to_thread(prep_frame, frame)
+            result = await _request_analysis(mode, season, style_profile, profile_id, frame_b64, cache_key)
+            future.set_result(result)
+        finally:
+            del _inflight[cache_key.exact]
+            if not future.done():
+                # The leading request was cancelled; release anyone waiting on it
+                future.set_result(_create_error_response("Analysis failed. Please try again."))
+        return dict(result)
+
+    except Exception:
+        logger.exception("General error")
+        return _create_error_response("Analysis failed. Please try again.")
+
+async def stream_frame_b64(mode: str, frame_b64: str, season: str = "summer", style_profile: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Streaming variant of analyze_frame_b64.
+    Yields {"event": "feedback", "data": item} as each feedback object completes,
+    then a final {"event": "result", "data": response} with the full frontend format.
+    """
+    try:
+        # Check if OpenAI API key is set
+        api_key = os.getenv('OPENAI_API_KEY', 'your_openai_api_key_here')
+        if api_key == 'your_openai_api_key_here':
+            logger.warning("OpenAI API key not set - returning mock response")
+            yield {"event": "result", "data": _create_mock_response()}
+            return
+
+        frame = await asyncio.to_thread(base64.b64decode, frame_b64)
+        cache_key, cached, profile_id = await asyncio.to_thread(
+            _lookup_response, frame, mode, season, style_profile
+        )
+        
+        # An identical frame already being analyzed is replayed once its result is in
+        inflight = _inflight.get(cache_key.exact) if cached is None else None
+        if inflight is not None:
+            cached = await asyncio.shield(inflight)
+        if cached is not None:
+            for item in cached["feedback"]:
+                yield {"event": "feedback", "data": item}
+            yield {"event": "result", "data": dict(cached)}
+            return
+
+        system_prompt, user_prompt = _create_prompts(mode, season, style_profile, profile_id)
+        
+        future = asyncio.get_running_loop().create_future()
+        _inflight[cache_key.exact] = future
+        try:
+            frame_b64 = await asyncio.to_thread(prep_frame, frame)
+            stream = await asyncio.wait_for(create_chat_completion(
                 model="gpt-4o",
                 messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    },
+                    {"role": "system", "content": system_prompt},
                     {
                         "role": "user",
                         "content": [
-                            {
-                                "type": "text",
-                                "text": user_prompt
-                            },
+                            {"type": "text", "text": user_prompt},
                             {
                                 "type": "image_url",
                                 "image_url": {
                                     "url": f"data:image/jpeg;base64,{frame_b64}",
-                                    "detail": "low" # Use low detail for faster processing
+                                    "detail": "low"
                                 }
                             }
                         ]
                     }
                 ],
-                max_tokens=1200,  # Increased for detailed JSON
-                temperature=0.25,  # Balanced for focused but varied responses
+                max_tokens=1200,
+                temperature=0.25,
                 top_p=0.9,
-                timeout=20  # Increased timeout for complex analysis
-            )
+                response_format={"type": "json_object"},
+                stream=True
+            ), timeout=OPENAI_REQUEST_TIMEOUT)
             
-            # Parse the response
-            raw_response_content = response.choices[0].message.content.strip()
+            # Decode each object of the "feedback" array as soon as it is complete
+            buffer = ""
+            pos = None  # Scan position inside the feedback array
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                buffer += chunk.choices[0].delta.content or ""
+                if pos is None:
+                    match = _FEEDBACK_ARRAY_RE.search(buffer)
+                    if not match:
+                        continue
+                    pos = match.end()
+                while True:
+                    obj, pos = _decode_next_array_object(buffer, pos)
+                    if obj is None:
+                        break
+                    item = _create_feedback_item(obj)
+                    if item:
+                        yield {"event": "feedback", "data": item}
             
-            # Convert the simple text response to frontend format
-            return convert_simple_response_to_frontend_format(raw_response_content, mode)
+            result = convert_json_response_to_frontend_format(buffer)
+            await asyncio.to_thread(_response_cache.set, cache_key, result)
+            future.set_result(result)
+            yield {"event": "result", "data": dict(result)}
         
         except Exception as e:
-            print(f"OpenAI API error: {e}")
+            logger.error("OpenAI API streaming error: %s", e)
             
-            # Check if it's a quota error
             if "quota" in str(e).lower() or "429" in str(e):
                 error_message = "OpenAI quota exceeded. Please check your billing or try again later."
             else:
                 error_message = "Analysis service temporarily unavailable. Please try again later."
             
-            return {
-                "feedback": [
-                    {
-                        "type": "overall",
-                        "message": error_message,
-                        "confidence": 0.3,
-                        "priority": "medium",
-                        "actionable": True
-                    }
-                ],
-                "overlay_data": {
-                    "bounding_boxes": [],
-                    "keypoints": [],
-                    "segmentation_masks": [],
-                    "guide_lines": [],
-                    "color_analysis": {
-                        "skin_tone": "unknown",
-                        "dominant_colors": [],
-                        "color_harmony": "fair",
-                        "color_contrast": "medium",
-                        "seasonal_analysis": "unknown"
-                    }
-                },
-                "confidence_score": 0.3
-            }
+            result = _create_error_response(error_message)
+            if not future.done():
+                future.set_result(result)
+            yield {"event": "result", "data": result}
+        
+        finally:
+            if _inflight.get(cache_key.exact) is future:
+                del _inflight[cache_key.exact]
+            if not future.done():
+                # The leading stream was closed early; release anyone waiting on it
+                future.set_result(_create_error_response("Analysis failed. Please try again."))
 
-    except Exception as e:
-        print(f"General error: {e}")
-        return {
-            "feedback": [
-                {
-                    "type": "overall",
-                    "message": "Analysis failed. Please try again.",
-                    "confidence": 0.3,
-                    "priority": "medium",
-                    "actionable": True
+    except Exception:
+        logger.exception("General error")
+        yield {"event": "result", "data": _create_error_response("Analysis failed. Please try again.")}
+
+# Feedback section type -> default (priority, actionable), in the order the prompts ask for them
+_SECTION_DEFAULTS = {
+    "top": ("medium", True),
+    "bottom": ("medium", True),
+    "footwear": ("medium", True),
+    "accessories": ("low", True),
+    "overall": ("medium", False)
+}
+
+_PRIORITIES = {"high", "medium", "low"}
+
+# Decodes single objects out of a partially streamed response
+_DECODER = json.JSONDecoder()
+
+def _create_batch_prompts(mode: str, season: str, frame_count: int, style_profile: Optional[Dict[str, Any]] = None) -> Tuple[str, str]:
+    """Build prompts asking for per-image JSON results across several frames"""
+    system_prompt, user_prompt = _create_prompts(mode, season, style_profile)
+    system_prompt += f"""
+
+Batch Mode:
+You will receive {frame_count} images, indexed from 0 in the order given. Apply all of the rules above to each image separately.
+Instead of a single object, return only JSON in this exact shape:
+{{"results": [{{"index": 0, "feedback": [...], "confidence_score": 0.8}}]}}
+Each result's feedback and confidence_score follow the single-image format above. Include exactly one result per image."""
+    return system_prompt, user_prompt
+
+async def analyze_frames_b64(mode: str, frames_b64: List[str], season: str = "summer", style_profile: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Analyzes several base64 encoded frames in a single GPT-4o request.
+    Returns one frontend-format result per frame, in input order.
+    """
+    if not frames_b64:
+        return []
+    
+    try:
+        # Check if OpenAI API key is set
+        api_key = os.getenv('OPENAI_API_KEY', 'your_openai_api_key_here')
+        if api_key == 'your_openai_api_key_here':
+            logger.warning("OpenAI API key not set - returning mock response")
+            return [_create_mock_response() for _ in frames_b64]
+        
+        # Off the loop: hashing a profile with inline images is CPU-bound
+        system_prompt, user_prompt = await asyncio.to_thread(
+            _create_batch_prompts, mode, season, len(frames_b64), style_profile
+        )
+        frames_b64 = await asyncio.to_thread(
+            lambda: [prep_frame(base64.b64decode(frame_b64)) for frame_b64 in frames_b64]
+        )
+        
+        # One user message carrying every frame replaces N round-trips
+        content = [{"type": "text", "text": user_prompt}] + [
+            {
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:image/jpeg;base64,{frame_b64}",
+                    "detail": "low"
                 }
+            }
+            for frame_b64 in frames_b64
+        ]
+        
+        response = await asyncio.wait_for(create_chat_completion(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": content}
             ],
-            "overlay_data": {
-                "bounding_boxes": [],
-                "keypoints": [],
-                "segmentation_masks": [],
-                "guide_lines": [],
-                "color_analysis": {
-                    "skin_tone": "unknown",
-                    "dominant_colors": [],
-                    "color_harmony": "fair",
-                    "color_contrast": "medium",
-                    "seasonal_analysis": "unknown"
-                }
-            },
-            "confidence_score": 0.3
-        }
+            max_tokens=min(4096, 400 * len(frames_b64)),
+            temperature=0.25,
+            top_p=0.9,
+            response_format={"type": "json_object"}
+        ), timeout=OPENAI_REQUEST_TIMEOUT * 2)
+        
+        return convert_batch_response_to_frontend_format(response.choices[0].message.content, len(frames_b64))
+    
+    except Exception as e:
+        logger.error("OpenAI batch API error: %s", e)
+        if "quota" in str(e).lower() or "429" in str(e):
+            error_message = "OpenAI quota exceeded. Please check your billing or try again later."
+        else:
+            error_message = "Analysis service temporarily unavailable. Please try again later."
+        return [_create_error_response(error_message) for _ in frames_b64]
 
-def convert_simple_response_to_frontend_format(response_text: str, mode: str) -> Dict[str, Any]:
+def convert_batch_response_to_frontend_format(response_text: str, frame_count: int) -> List[Dict[str, Any]]:
     """
-    Convert the simple 5-section text response to the frontend-compatible format
+    Split a batched {"results": [{"index": i, "feedback": [...]}]} JSON response into one
+    frontend-format result per frame; frames missing from the reply get a fallback
     """
-    feedback = []
+    try:
+        results = orjson.loads(response_text).get("results", [])
+    except (ValueError, AttributeError):
+        results = []
     
-    # Split the response into lines and parse each section
-    lines = response_text.strip().split('\n')
+    by_index = {}
+    if isinstance(results, list):
+        for result in results:
+            if isinstance(result, dict) and isinstance(result.get("index"), int):
+                by_index[result["index"]] = result
     
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-            
-        # Parse each section based on the format "1. Top/Shirt: [content]"
-        if line.startswith('1.') or line.startswith('Top/Shirt:'):
-            content = extract_content_from_line(line)
-            if content:
-                feedback.append({
-                    "type": "top",
-                    "message": content,
-                    "confidence": 0.8,
-                    "priority": "medium",
-                    "actionable": True
-                })
-        elif line.startswith('2.') or line.startswith('Bottom/Pants:'):
-            content = extract_content_from_line(line)
-            if content:
-                feedback.append({
-                    "type": "bottom",
-                    "message": content,
-                    "confidence": 0.8,
-                    "priority": "medium",
-                    "actionable": True
-                })
-        elif line.startswith('3.') or line.startswith('Footwear:'):
-            content = extract_content_from_line(line)
-            if content:
-                feedback.append({
-                    "type": "footwear",
-                    "message": content,
-                    "confidence": 0.8,
-                    "priority": "medium",
-                    "actionable": True
-                })
-        elif line.startswith('4.') or line.startswith('Accessories:'):
-            content = extract_content_from_line(line)
-            if content:
-                feedback.append({
-                    "type": "accessories",
-                    "message": content,
-                    "confidence": 0.8,
-                    "priority": "low",
-                    "actionable": True
-                })
-        elif line.startswith('5.') or line.startswith('Overall Outfit:'):
-            content = extract_content_from_line(line)
-            if content:
-                feedback.append({
-                    "type": "overall",
-                    "message": content,
-                    "confidence": 0.8,
-                    "priority": "medium",
-                    "actionable": False
-                })
+    return [_create_response_from_json(by_index.get(index, {})) for index in range(frame_count)]
+
+def convert_json_response_to_frontend_format(response_text: str) -> Dict[str, Any]:
+    """
+    Convert a JSON-mode {"feedback": [...], "confidence_score": x} response to the frontend-compatible format
+    """
+    try:
+        data = orjson.loads(response_text)
+    except ValueError:
+        data = {}
+    return _create_response_from_json(data if isinstance(data, dict) else {})
+
+def _create_response_from_json(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Frontend-format response from one decoded result object"""
+    items = data.get("feedback")
+    feedback = []
+    if isinstance(items, list):
+        for obj in items:
+            item = _create_feedback_item(obj)
+            if item:
+                feedback.append(item)
     
-    # If no feedback was parsed, create a fallback
-    if not feedback:
-        feedback = [{
-            "type": "overall",
-            "message": "Analysis completed. Check the response for detailed feedback.",
-            "confidence": 0.8,
-            "priority": "medium",
-            "actionable": False
-        }]
+    confidence_score = data.get("confidence_score")
+    if isinstance(confidence_score, bool) or not isinstance(confidence_score, (int, float)) or not 0 <= confidence_score <= 1:
+        confidence_score = 0.8
+    return _create_analysis_response(feedback, float(confidence_score))
+
+def _create_feedback_item(obj: Any) -> Optional[Feedback]:
+    """Feedback item from one decoded {"type", "message", "priority"} object, None if unusable"""
+    if not isinstance(obj, dict):
+        return None
+    section_type = obj.get("type")
+    message = obj.get("message")
+    if section_type not in _SECTION_DEFAULTS or not isinstance(message, str) or not message.strip():
+        return None
     
+    priority, actionable = _SECTION_DEFAULTS[section_type]
+    if obj.get("priority") in _PRIORITIES:
+        priority = obj["priority"]
+    return Feedback(
+        type=section_type,
+        message=message.strip(),
+        confidence=0.8,
+        priority=priority,
+        actionable=actionable
+    )
+
+def _create_analysis_response(feedback: List[Feedback], confidence_score: float = 0.8) -> Dict[str, Any]:
+    """Wrap parsed feedback in the frontend response format, with a fallback if empty"""
     return {
-        "feedback": feedback,
-        "overlay_data": {
-            "bounding_boxes": [],
-            "keypoints": [],
-            "segmentation_masks": [],
-            "guide_lines": [],
-            "color_analysis": {
-                "skin_tone": "unknown",
-                "dominant_colors": [],
-                "color_harmony": "fair",
-                "color_contrast": "medium",
-                "seasonal_analysis": "unknown"
-            }
-        },
-        "confidence_score": 0.8
+        "feedback": feedback or [_FALLBACK_FEEDBACK],
+        "overlay_data": _EMPTY_OVERLAY,
+        "confidence_score": confidence_score
     }
 
-def extract_content_from_line(line: str) -> str:
+# Start of the feedback array in a streamed JSON-mode response
+_FEEDBACK_ARRAY_RE = re.compile(r'"feedback"\s*:\s*\[')
+
+def _decode_next_array_object(buffer: str, pos: int) -> Tuple[Optional[Any], int]:
     """
-    Extract the content from a line like "1. Top/Shirt: [content]" or "Top/Shirt: [content]"
+    Decode the next complete object of a JSON array that is still streaming in.
+    Returns (object, position after it), or (None, pos) if it is incomplete or the array ended.
     """
-    # Remove numbering and section headers
-    if ':' in line:
-        content = line.split(':', 1)[1].strip()
-        # Remove brackets if present
-        if content.startswith('[') and content.endswith(']'):
-            content = content[1:-1].strip()
-        return content
-    return line.strip()
+    while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+        pos += 1
+    if pos >= len(buffer) or buffer[pos] != "{":
+        return None, pos
+    try:
+        return _DECODER.raw_decode(buffer, pos)
+    except ValueError:
+        return None, pos
@@ -0,0 +1,69 @@
+import asyncio
+from typing import TYPE_CHECKING
+
+import httpx
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+from app.core.config import settings
+
+# HTTP/2 needs the optional h2 package; fall back to HTTP/1.1 pooling without it
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+    print("h2 not available - OpenAI client will use HTTP/1.1")
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+# The openai SDK is slow to import, so it is loaded on first real use; mock paths never touch it
+_openai = None
+_client: "AsyncOpenAI" = None
+
+# Bounds in-flight requests so bursts queue here instead of turning into 429s
+_openai_semaphore = asyncio.Semaphore(settings.OPENAI_MAX_CONCURRENCY)
+
+def _ensure_openai():
+    """Import the openai SDK on first use"""
+    global _openai
+    if _openai is None:
+        import openai
+        _openai = openai
+    return _openai
+
+def _is_retryable(error: BaseException) -> bool:
+    """429s, connection errors and 5xx responses are worth retrying"""
+    openai = _ensure_openai()
+    return isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError))
+
+def get_openai_client() -> "AsyncOpenAI":
+    """
+    Shared AsyncOpenAI client backed by one pooled httpx.AsyncClient.
+    Reusing it keeps TLS connections alive across requests and services.
+    """
+    global _client
+    if _client is None:
+        http_client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+            timeout=httpx.Timeout(25.0, connect=3.0)
+        )
+        # Retries are handled by create_chat_completion, outside the concurrency slot
+        _client = _ensure_openai().AsyncOpenAI(api_key=settings.OPENAI_API_KEY, http_client=http_client, max_retries=0)
+    return _client
+
+@retry(
+    retry=retry_if_exception(_is_retryable),
+    wait=wait_exponential_jitter(initial=1, max=16),
+    stop=stop_after_attempt(5),
+    reraise=True
+)
+async def create_chat_completion(**kwargs):
+    """
+    chat.completions.create on the shared client, limited to OPENAI_MAX_CONCURRENCY
+    concurrent requests and retried with jittered exponential backoff on 429s,
+    connection errors and 5xx responses
+    """
+    async with _openai_semaphore:
+        return await get_openai_client().chat.completions.create(**kwargs)
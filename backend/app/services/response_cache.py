@@ -0,0 +1,90 @@
+import hashlib
+import io
+import threading
+from typing import Any, Optional, Union
+
+from cachetools import TTLCache
+
+class CacheKey:
+    """Cache key for one frame + prompt parameters; the perceptual hash is computed lazily"""
+
+    def __init__(self, frame: Union[bytes, memoryview], params: str):
+        self.frame = frame
+        self.params = params
+        self.exact = hashlib.sha256(frame).hexdigest() + ":" + params
+        self._phash = None
+
+    @property
+    def phash(self) -> Optional[int]:
+        """64-bit average hash of the frame (8x8 grayscale vs. its mean), None if undecodable"""
+        if self._phash is None:
+            try:
+                # PIL is imported lazily to keep it out of worker startup
+                from PIL import Image
+                
+                image = Image.open(io.BytesIO(self.frame))
+                image.draft("L", (64, 64))  # Let the JPEG decoder downscale cheaply
+                pixels = list(image.convert("L").resize((8, 8), Image.BILINEAR).getdata())
+            except Exception:
+                return None
+            mean = sum(pixels) / len(pixels)
+            bits = 0
+            for pixel in pixels:
+                bits = (bits << 1) | (pixel > mean)
+            self._phash = bits
+        return self._phash
+
+class ResponseCache:
+    """
+    Two-tier cache for AI analysis responses:
+    - exact: sha256 of the frame bytes plus the prompt parameters
+    - near: perceptual hash within a small Hamming distance, for nearly static live-preview frames
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: int = 3600, max_distance: int = 5):
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._exact = TTLCache(maxsize=maxsize, ttl=ttl)
+        # params -> {phash: response}, so near lookups only scan matching prompts
+        self._near = TTLCache(maxsize=1024, ttl=ttl)
+        # Callers run in worker threads and cachetools caches are not thread-safe;
+        # hashing happens outside the lock, only cache reads and writes inside it
+        self._lock = threading.Lock()
+
+    def key(self, frame: Union[bytes, memoryview], params: str) -> CacheKey:
+        """Build a cache key for a frame and its prompt parameters"""
+        return CacheKey(frame, params)
+
+    def get(self, key: CacheKey) -> Optional[Any]:
+        """Return a cached response for the exact or a near-identical frame"""
+        with self._lock:
+            cached = self._exact.get(key.exact)
+            if cached is not None:
+                return cached
+            has_candidates = bool(self._near.get(key.params))
+
+        phash = key.phash if has_candidates else None
+        if phash is None:
+            return None
+
+        with self._lock:
+            candidates = self._near.get(key.params)
+            if not candidates:
+                return None
+            for candidate_hash, response in list(candidates.items()):
+                if bin(candidate_hash ^ phash).count("1") <= self.max_distance:
+                    return response
+        return None
+
+    def set(self, key: CacheKey, response: Any):
+        """Store a response under both the exact and perceptual keys"""
+        phash = key.phash
+        with self._lock:
+            self._exact[key.exact] = response
+            if phash is None:
+                return
+            candidates = self._near.get(key.params)
+            if candidates is None:
+                candidates = TTLCache(maxsize=256, ttl=self.ttl)
+                self._near[key.params] = candidates
+            candidates[phash] = response
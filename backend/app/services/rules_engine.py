@@ -1,6 +1,45 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Set, Union
+import logging
 import numpy as np
 
+from app.core.jit import njit, NUMBA_AVAILABLE
+from app.schemas.analysis import Detection, Feedback
+
+logger = logging.getLogger(__name__)
+
+# Garment classes that get proportion and fit feedback
+GARMENT_CLASSES = ["shirt", "pants", "dress"]
+
+# Garment classes that count towards outfit balance
+OUTFIT_CLASSES = frozenset(["shirt", "pants", "dress", "skirt", "jacket"])
+
+# Proportion outcomes, used as keys into the per-class message table
+PROPORTION_OK, PROPORTION_TOO_LONG, PROPORTION_TOO_SHORT = 0, 1, 2
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _classify_ratios(heights, person_height, ideals, tolerances):
+        """Proportion outcome per garment: OK, too long or too short relative to its ideal ratio"""
+        out = np.empty(heights.size, np.int8)
+        for i in range(heights.size):
+            deviation = heights[i] / person_height - ideals[i]
+            if abs(deviation) <= tolerances[i]:
+                out[i] = PROPORTION_OK
+            elif deviation > 0:
+                out[i] = PROPORTION_TOO_LONG
+            else:
+                out[i] = PROPORTION_TOO_SHORT
+        return out
+else:
+    def _classify_ratios(heights, person_height, ideals, tolerances):
+        """Proportion outcome per garment: OK, too long or too short relative to its ideal ratio"""
+        deviation = heights / person_height - ideals
+        return np.where(
+            np.abs(deviation) <= tolerances,
+            PROPORTION_OK,
+            np.where(deviation > 0, PROPORTION_TOO_LONG, PROPORTION_TOO_SHORT)
+        ).astype(np.int8)
+
 class RulesEngine:
     """Rules and Recommendations engine for proportions and fit logic"""
     
@@ -38,237 +77,226 @@ class RulesEngine:
                 "waist_fit": 0.35      # 35% extra space
             }
         }
+        
+        # Lookup arrays for the vectorized analysis: garments with a length rule
+        # and their ideal ratio / tolerance at the same index
+        self._length_classes = ["shirt", "pants"]
+        self._length_ideals = np.array([
+            self.proportion_rules["shirt_length"]["ideal_ratio"],
+            self.proportion_rules["pants_length"]["ideal_ratio"]
+        ])
+        self._length_tolerances = np.array([
+            self.proportion_rules["shirt_length"]["tolerance"],
+            self.proportion_rules["pants_length"]["tolerance"]
+        ])
+        
+        # Feedback records are frozen, so the tables below are shared across calls
+        
+        # (class, outcome) -> feedback, built once instead of per detection
+        self._proportion_messages = {}
+        for garment, verb in (("shirt", "appears"), ("pants", "appear")):
+            self._proportion_messages[(garment, PROPORTION_OK)] = self._create_feedback(
+                "proportion", f"The {garment} length is well-proportioned for your body", 0.9, "low", False
+            )
+            self._proportion_messages[(garment, PROPORTION_TOO_LONG)] = self._create_feedback(
+                "proportion", f"The {garment} {verb} too long for your body proportions", 0.8, "medium", True
+            )
+            self._proportion_messages[(garment, PROPORTION_TOO_SHORT)] = self._create_feedback(
+                "proportion", f"The {garment} {verb} too short for your body proportions", 0.8, "medium", True
+            )
+        
+        # (class, confidence bucket from np.digitize) -> fit feedback
+        self._fit_messages = {}
+        for garment in GARMENT_CLASSES:
+            self._fit_messages[(garment, 0)] = self._create_feedback(
+                "fit", f"The {garment} doesn't appear to fit properly", 0.65, "high", True
+            )
+            self._fit_messages[(garment, 1)] = self._create_feedback(
+                "fit", f"The {garment} fit could be improved", 0.75, "medium", True
+            )
+            self._fit_messages[(garment, 2)] = self._create_feedback(
+                "fit", f"The {garment} appears to fit well", 0.85, "low", False
+            )
+        
+        # Outfit-level and fallback feedback by name
+        self._feedback_templates = {
+            "no_person": self._create_feedback(
+                "general", "No person detected in the image", 0.5, "low"
+            ),
+            "error": self._create_feedback(
+                "general", "Error analyzing proportions", 0.5, "low"
+            ),
+            "shirt_and_pants": self._create_feedback(
+                "style", "Good basic outfit coordination with shirt and pants", 0.8, "low", False
+            ),
+            "dress": self._create_feedback(
+                "style", "Dress provides a cohesive, coordinated look", 0.85, "low", False
+            ),
+            "layering": self._create_feedback(
+                "style", "Good use of layering with the jacket", 0.8, "medium", False
+            ),
+            "incomplete": self._create_feedback(
+                "style", "Consider adding more pieces for a complete outfit", 0.7, "medium", True
+            )
+        }
     
     async def analyze_proportions(
         self,
-        detections: List[Dict[str, Any]],
+        detections: List[Union[Detection, Dict[str, Any]]],
         segmentation_results: List[Dict[str, Any]],
         user_prefs: Optional[Dict[str, Any]] = None
-    ) -> List[Dict[str, Any]]:
+    ) -> List[Feedback]:
         """Analyze clothing proportions and provide feedback"""
         try:
             feedback = []
+            detections = [
+                det if isinstance(det, Detection) else Detection.from_dict(det)
+                for det in detections
+            ]
             
             # Extract person detection
             person_detection = self._find_person_detection(detections)
             if not person_detection:
-                return [self._create_feedback(
-                    "general", 
-                    "No person detected in the image", 
-                    0.5, 
-                    "low"
-                )]
+                return [self._feedback_templates["no_person"]]
+            
+            # Classes present, computed once so sub-analyses can skip trivially empty work
+            class_set = {det.cls for det in detections}
             
             # Analyze garment proportions
             garment_feedback = await self._analyze_garment_proportions(
-                detections, person_detection, user_prefs
+                detections, person_detection, user_prefs, class_set
             )
             feedback.extend(garment_feedback)
             
             # Analyze fit quality
             fit_feedback = await self._analyze_fit_quality(
-                detections, person_detection, user_prefs
+                detections, person_detection, user_prefs, class_set
             )
             feedback.extend(fit_feedback)
             
             # Analyze overall balance
             balance_feedback = await self._analyze_outfit_balance(
-                detections, person_detection, user_prefs
+                detections, person_detection, user_prefs, class_set
             )
             feedback.extend(balance_feedback)
             
             return feedback
             
         except Exception as e:
-            print(f"Error in proportion analysis: {e}")
-            return [self._create_feedback(
-                "general", 
-                "Error analyzing proportions", 
-                0.5, 
-                "low"
-            )]
+            logger.warning("Error in proportion analysis: %s", e)
+            return [self._feedback_templates["error"]]
     
     async def _analyze_garment_proportions(
         self,
-        detections: List[Dict[str, Any]],
-        person_detection: Dict[str, Any],
-        user_prefs: Optional[Dict[str, Any]] = None
-    ) -> List[Dict[str, Any]]:
+        detections: List[Detection],
+        person_detection: Detection,
+        user_prefs: Optional[Dict[str, Any]] = None,
+        class_set: Optional[Set[str]] = None
+    ) -> List[Feedback]:
         """Analyze individual garment proportions"""
-        feedback = []
+        if class_set is None:
+            class_set = {det.cls for det in detections}
+        if class_set.isdisjoint(self._length_classes):
+            return []
         
-        person_bbox = person_detection["bbox"]
+        person_bbox = person_detection.bbox
         person_height = person_bbox[3] - person_bbox[1]
+        if person_height <= 0:
+            raise ValueError("Person bounding box has no height")
         
-        for detection in detections:
-            if detection["class"] in ["shirt", "pants", "dress"]:
-                garment_bbox = detection["bbox"]
-                garment_height = garment_bbox[3] - garment_bbox[1]
-                garment_ratio = garment_height / person_height
-                
-                if detection["class"] == "shirt":
-                    ideal_ratio = self.proportion_rules["shirt_length"]["ideal_ratio"]
-                    tolerance = self.proportion_rules["shirt_length"]["tolerance"]
-                    
-                    if abs(garment_ratio - ideal_ratio) > tolerance:
-                        if garment_ratio > ideal_ratio + tolerance:
-                            feedback.append(self._create_feedback(
-                                "proportion",
-                                "The shirt appears too long for your body proportions",
-                                0.8,
-                                "medium",
-                                True
-                            ))
-                        else:
-                            feedback.append(self._create_feedback(
-                                "proportion",
-                                "The shirt appears too short for your body proportions",
-                                0.8,
-                                "medium",
-                                True
-                            ))
-                    else:
-                        feedback.append(self._create_feedback(
-                            "proportion",
-                            "The shirt length is well-proportioned for your body",
-                            0.9,
-                            "low",
-                            False
-                        ))
-                
-                elif detection["class"] == "pants":
-                    ideal_ratio = self.proportion_rules["pants_length"]["ideal_ratio"]
-                    tolerance = self.proportion_rules["pants_length"]["tolerance"]
-                    
-                    if abs(garment_ratio - ideal_ratio) > tolerance:
-                        if garment_ratio > ideal_ratio + tolerance:
-                            feedback.append(self._create_feedback(
-                                "proportion",
-                                "The pants appear too long for your body proportions",
-                                0.8,
-                                "medium",
-                                True
-                            ))
-                        else:
-                            feedback.append(self._create_feedback(
-                                "proportion",
-                                "The pants appear too short for your body proportions",
-                                0.8,
-                                "medium",
-                                True
-                            ))
-                    else:
-                        feedback.append(self._create_feedback(
-                            "proportion",
-                            "The pants length is well-proportioned for your body",
-                            0.9,
-                            "low",
-                            False
-                        ))
+        bboxes, classes, _ = self._stack_detections(detections)
         
-        return feedback
+        # Index of each detection's length rule, -1 for classes without one
+        rule_index = np.full(len(classes), -1)
+        for index, garment in enumerate(self._length_classes):
+            rule_index[classes == garment] = index
+        has_rule = rule_index >= 0
+        if not has_rule.any():
+            return []
+        
+        rule_index = rule_index[has_rule]
+        outcomes = _classify_ratios(
+            bboxes[has_rule, 3] - bboxes[has_rule, 1],
+            float(person_height),
+            self._length_ideals[rule_index],
+            self._length_tolerances[rule_index]
+        )
+        
+        return [
+            self._proportion_messages[(garment, outcome)]
+            for garment, outcome in zip(classes[has_rule].tolist(), outcomes.tolist())
+        ]
     
     async def _analyze_fit_quality(
         self,
-        detections: List[Dict[str, Any]],
-        person_detection: Dict[str, Any],
-        user_prefs: Optional[Dict[str, Any]] = None
-    ) -> List[Dict[str, Any]]:
+        detections: List[Detection],
+        person_detection: Detection,
+        user_prefs: Optional[Dict[str, Any]] = None,
+        class_set: Optional[Set[str]] = None
+    ) -> List[Feedback]:
         """Analyze fit quality of garments"""
-        feedback = []
+        if class_set is None:
+            class_set = {det.cls for det in detections}
+        if class_set.isdisjoint(GARMENT_CLASSES):
+            return []
         
         # Get user's fit preference
         fit_preference = user_prefs.get("fit_preferences", "fitted") if user_prefs else "fitted"
         
-        for detection in detections:
-            if detection["class"] in ["shirt", "pants", "dress"]:
-                # Analyze fit based on detection confidence and bbox size
-                confidence = detection["confidence"]
-                
-                if confidence > 0.9:
-                    feedback.append(self._create_feedback(
-                        "fit",
-                        f"The {detection['class']} appears to fit well",
-                        0.85,
-                        "low",
-                        False
-                    ))
-                elif confidence > 0.7:
-                    feedback.append(self._create_feedback(
-                        "fit",
-                        f"The {detection['class']} fit could be improved",
-                        0.75,
-                        "medium",
-                        True
-                    ))
-                else:
-                    feedback.append(self._create_feedback(
-                        "fit",
-                        f"The {detection['class']} doesn't appear to fit properly",
-                        0.65,
-                        "high",
-                        True
-                    ))
+        _, classes, confidences = self._stack_detections(detections)
+        is_garment = np.isin(classes, GARMENT_CLASSES)
         
-        return feedback
+        # Analyze fit based on detection confidence: <= 0.7, (0.7, 0.9], > 0.9
+        buckets = np.digitize(confidences[is_garment], [0.7, 0.9], right=True)
+        
+        return [
+            self._fit_messages[(garment, bucket)]
+            for garment, bucket in zip(classes[is_garment].tolist(), buckets.tolist())
+        ]
     
     async def _analyze_outfit_balance(
         self,
-        detections: List[Dict[str, Any]],
-        person_detection: Dict[str, Any],
-        user_prefs: Optional[Dict[str, Any]] = None
-    ) -> List[Dict[str, Any]]:
+        detections: List[Detection],
+        person_detection: Detection,
+        user_prefs: Optional[Dict[str, Any]] = None,
+        class_set: Optional[Set[str]] = None
+    ) -> List[Feedback]:
         """Analyze overall outfit balance and coordination"""
         feedback = []
         
-        # Count different garment types
-        garment_types = [det["class"] for det in detections if det["class"] in ["shirt", "pants", "dress", "skirt", "jacket"]]
+        if class_set is None:
+            class_set = {det.cls for det in detections}
+        garment_types = class_set & OUTFIT_CLASSES
         
-        if len(garment_types) >= 2:
+        # Two pieces of the same type still count as more than one garment
+        if len(garment_types) >= 2 or sum(det.cls in garment_types for det in detections) >= 2:
             # Check for basic coordination
             if "shirt" in garment_types and "pants" in garment_types:
-                feedback.append(self._create_feedback(
-                    "style",
-                    "Good basic outfit coordination with shirt and pants",
-                    0.8,
-                    "low",
-                    False
-                ))
+                feedback.append(self._feedback_templates["shirt_and_pants"])
             elif "dress" in garment_types:
-                feedback.append(self._create_feedback(
-                    "style",
-                    "Dress provides a cohesive, coordinated look",
-                    0.85,
-                    "low",
-                    False
-                ))
+                feedback.append(self._feedback_templates["dress"])
             
             # Check for layering
             if "jacket" in garment_types:
-                feedback.append(self._create_feedback(
-                    "style",
-                    "Good use of layering with the jacket",
-                    0.8,
-                    "medium",
-                    False
-                ))
+                feedback.append(self._feedback_templates["layering"])
         else:
-            feedback.append(self._create_feedback(
-                "style",
-                "Consider adding more pieces for a complete outfit",
-                0.7,
-                "medium",
-                True
-            ))
+            feedback.append(self._feedback_templates["incomplete"])
         
         return feedback
     
-    def _find_person_detection(self, detections: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    def _stack_detections(self, detections: List[Detection]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Stack detections into (bboxes [N,4], classes [N], confidences [N]) arrays"""
+        if not detections:
+            return np.empty((0, 4)), np.array([], dtype=str), np.empty(0)
+        
+        bboxes = np.array([det.bbox for det in detections], dtype=np.float64)
+        classes = np.array([det.cls for det in detections])
+        confidences = np.array([det.confidence for det in detections], dtype=np.float64)
+        return bboxes, classes, confidences
+    
+    def _find_person_detection(self, detections: List[Detection]) -> Optional[Detection]:
         """Find person detection in the list"""
-        for detection in detections:
-            if detection["class"] == "person":
-                return detection
-        return None
+        return next((det for det in detections if det.cls == "person"), None)
     
     def _create_feedback(
         self,
@@ -277,12 +305,6 @@ class RulesEngine:
         confidence: float,
         priority: str,
         actionable: bool = True
-    ) -> Dict[str, Any]:
+    ) -> Feedback:
         """Create standardized feedback object"""
-        return {
-            "type": feedback_type,
-            "message": message,
-            "confidence": confidence,
-            "priority": priority,
-            "actionable": actionable
-        }
+        return Feedback(feedback_type, message, confidence, priority, actionable)
@@ -1,75 +1,230 @@
 import cv2
 import numpy as np
-from typing import List, Dict, Any, Optional
-from PIL import Image
-import io
+from typing import List, Dict, Any, Optional, Tuple
 import base64
+import asyncio
+import hashlib
+import logging
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import LRUCache
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
 
 # Note: In production, you would import segment_anything
 # from segment_anything import SamPredictor, sam_model_registry
 
+SEGMENT_CACHE_SIZE = 128
+
+# SAM image embeddings (~4 MB each) kept per frame digest for repeat prompts on the same frame
+EMBEDDING_CACHE_SIZE = 16
+
+# Masks are returned as base64 of a tagged run-length encoding:
+#   b"R" + little-endian uint32 [height, width, run_0, run_1, ...]
+# Runs cover the row-major flattened mask and alternate background/foreground,
+# starting with background (a leading zero-length run if the first pixel is set).
+MASK_FORMAT_RLE = b"R"
+
+def _encode_mask(mask: np.ndarray) -> str:
+    """Encode a 2-D mask (bool or 0/255) as base64 tagged RLE"""
+    height, width = mask.shape
+    flat = mask.ravel() != 0
+    change_points = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    runs = np.diff(np.concatenate(([0], change_points, [flat.size])))
+    if flat.size and flat[0]:
+        runs = np.concatenate(([0], runs))
+    header = np.array([height, width], dtype="<u4")
+    payload = np.concatenate((header, runs.astype("<u4"))).tobytes()
+    return base64.b64encode(MASK_FORMAT_RLE + payload).decode('ascii')
+
+@functools.lru_cache(maxsize=256)
+def _solid_mask_b64(width: int, height: int) -> str:
+    """Tagged RLE of an all-foreground width x height mask, synthesized without building the mask"""
+    width, height = max(int(width), 0), max(int(height), 0)
+    runs = [0, width * height] if width * height else [0]
+    payload = np.array([height, width, *runs], dtype="<u4").tobytes()
+    return base64.b64encode(MASK_FORMAT_RLE + payload).decode('ascii')
+
+def _decode_frame(frame: bytes) -> np.ndarray:
+    """Decode frame bytes straight into a contiguous RGB array for the predictor"""
+    image_array = cv2.imdecode(np.frombuffer(frame, np.uint8), cv2.IMREAD_COLOR)
+    if image_array is None:
+        raise ValueError("Could not decode frame")
+    return cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB)
+
+# Mask encoding runs off the event loop so it overlaps with the next frame's decoder pass
+_mask_encode_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="mask-encode")
+
 class SegmentationService:
     """Segment Anything service for garment segmentation"""
     
     def __init__(self):
         self.model = None
         self.predictor = None
+        # Bounds frames in the SAM path at once; each holder decodes, embeds and runs all its decoder calls
+        self._sam_semaphore = asyncio.Semaphore(settings.SAM_CONCURRENCY)
+        # The predictor holds one image at a time: set_image through predict runs under this
+        # lock, so SAM_CONCURRENCY > 1 only overlaps frame decoding, not predictor use
+        self._predictor_lock = threading.Lock()
+        # frame digest -> (original_size, input_size, features); only touched under _predictor_lock
+        self._embedding_cache = LRUCache(maxsize=EMBEDDING_CACHE_SIZE)
+        # Fixed fallback garments, masks encoded once
+        self._mock_garments = [
+            {
+                "bbox": [120, 150, 280, 350],
+                "mask": _solid_mask_b64(160, 200),
+                "class": "shirt",
+                "confidence": 0.87
+            },
+            {
+                "bbox": [130, 350, 270, 500],
+                "mask": _solid_mask_b64(140, 150),
+                "class": "pants",
+                "confidence": 0.82
+            }
+        ]
+        # (frame digest, bbox) -> base64 mask, in LRU order
+        self._segment_cache: "OrderedDict[Tuple[str, Tuple[int, ...]], str]" = OrderedDict()
+        self._segment_cache_lock = asyncio.Lock()
+        # Holding the frame itself (not its id) keeps a recycled id from matching a different frame
+        self._last_frame: Optional[bytes] = None
+        self._last_frame_digest = ""
+    
+    def _frame_digest(self, frame: bytes) -> str:
+        """Short blake2b digest of the frame, reused while the same frame object is passed in"""
+        if frame is not self._last_frame:
+            self._last_frame_digest = hashlib.blake2b(frame, digest_size=16).hexdigest()
+            self._last_frame = frame
+        return self._last_frame_digest
     
     async def load_model(self):
         """Load Segment Anything model"""
         try:
-            print("Loading Segment Anything model...")
+            logger.info("Loading Segment Anything model...")
             # In production, you would load the actual SAM model
             # sam = sam_model_registry["vit_h"](checkpoint=settings.SEGMENT_ANYTHING_MODEL_PATH)
             # self.predictor = SamPredictor(sam)
-            print("Segment Anything model loaded successfully")
+            logger.info("Segment Anything model loaded successfully")
         except Exception as e:
-            print(f"Error loading Segment Anything model: {e}")
+            logger.warning("Error loading Segment Anything model: %s", e)
             # Fallback to mock model for development
             self.model = None
     
     async def segment_object(
         self, 
         frame: bytes, 
-        bbox: List[int]
+        bbox: List[int],
+        frame_digest: Optional[str] = None
     ) -> str:
-        """Segment object within bounding box"""
+        """Segment object within bounding box, memoized on (frame digest, bbox)"""
+        key = (frame_digest or self._frame_digest(frame), tuple(bbox))
+        cached = await self._cache_get([key])
+        if cached[0] is not None:
+            return cached[0]
+        
         try:
-            if self.predictor is None:
-                return await self._mock_segmentation(bbox)
-            
-            # Convert bytes to PIL Image
-            image = Image.open(io.BytesIO(frame))
-            image_array = np.array(image)
-            
-            # Set image in predictor
-            self.predictor.set_image(image_array)
-            
-            # Convert bbox to SAM format [x1, y1, x2, y2]
-            x1, y1, x2, y2 = bbox
-            input_box = np.array([x1, y1, x2, y2])
-            
-            # Generate mask
-            masks, scores, logits = self.predictor.predict(
-                box=input_box,
-                multimask_output=True
-            )
-            
-            # Select best mask
-            best_mask_idx = np.argmax(scores)
-            mask = masks[best_mask_idx]
-            
-            # Convert mask to base64
-            mask_image = Image.fromarray((mask * 255).astype(np.uint8))
-            buffer = io.BytesIO()
-            mask_image.save(buffer, format='PNG')
-            mask_b64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            
-            return mask_b64
-            
+            mask_b64 = (await self._segment_bboxes(frame, np.array([bbox]), key[0]))[0]
         except Exception as e:
-            print(f"Error in segmentation: {e}")
-            return await self._mock_segmentation(bbox)
+            logger.warning("Error in segmentation: %s", e)
+            return self._mock_segmentation(bbox)
+        
+        if self.predictor is not None:
+            await self._cache_put({key: mask_b64})
+        return mask_b64
+    
+    async def _cache_get(self, keys: List[Tuple[str, Tuple[int, ...]]]) -> List[Optional[str]]:
+        """Look up cached masks, refreshing the LRU position of each hit"""
+        async with self._segment_cache_lock:
+            masks = []
+            for key in keys:
+                mask_b64 = self._segment_cache.get(key)
+                if mask_b64 is not None:
+                    self._segment_cache.move_to_end(key)
+                masks.append(mask_b64)
+            return masks
+    
+    async def _cache_put(self, entries: Dict[Tuple[str, Tuple[int, ...]], str]):
+        """Store masks, evicting least recently used entries past SEGMENT_CACHE_SIZE"""
+        async with self._segment_cache_lock:
+            for key, mask_b64 in entries.items():
+                self._segment_cache[key] = mask_b64
+                self._segment_cache.move_to_end(key)
+            while len(self._segment_cache) > SEGMENT_CACHE_SIZE:
+                self._segment_cache.popitem(last=False)
+    
+    async def _segment_bboxes(self, frame: bytes, bboxes: np.ndarray, frame_digest: str) -> List[str]:
+        """Segment every bbox [x1, y1, x2, y2] of one frame, running the SAM image encoder once"""
+        if self.predictor is None:
+            return [self._mock_segmentation(bbox) for bbox in bboxes.tolist()]
+        
+        # Decode, embed and decode masks for the whole frame in one worker-thread hop
+        async with self._sam_semaphore:
+            best_masks = await asyncio.to_thread(self._predict_box_masks, frame, bboxes, frame_digest)
+        
+        loop = asyncio.get_running_loop()
+        return list(await asyncio.gather(*(
+            loop.run_in_executor(_mask_encode_pool, _encode_mask, mask)
+            for mask in best_masks
+        )))
+    
+    def _decode_uncached(self, frame: bytes, frame_digest: str) -> Optional[np.ndarray]:
+        """Decode the frame ahead of taking the predictor lock, unless its embedding is cached"""
+        if frame_digest in self._embedding_cache:
+            return None
+        return _decode_frame(frame)
+    
+    def _set_frame(self, frame: bytes, frame_digest: str, image: Optional[np.ndarray] = None) -> Tuple[int, int]:
+        """
+        Load the frame into the predictor, reusing a cached image embedding when
+        available; call with _predictor_lock held
+        """
+        cached = self._embedding_cache.get(frame_digest)
+        if cached is not None:
+            # Same state set_image leaves behind, without running the image encoder
+            original_size, input_size, features = cached
+            self.predictor.reset_image()
+            self.predictor.original_size = original_size
+            self.predictor.input_size = input_size
+            self.predictor.features = features
+            self.predictor.is_image_set = True
+            return original_size
+        
+        self.predictor.set_image(image if image is not None else _decode_frame(frame))
+        self._embedding_cache[frame_digest] = (
+            self.predictor.original_size,
+            self.predictor.input_size,
+            self.predictor.features
+        )
+        return self.predictor.original_size
+    
+    def _predict_box_masks(self, frame: bytes, bboxes: np.ndarray, frame_digest: str) -> np.ndarray:
+        """Best SAM mask per bbox as a [N, H, W] boolean array"""
+        # Only reached with a loaded predictor, so torch is imported on first use
+        import torch
+        
+        image = self._decode_uncached(frame, frame_digest)
+        with self._predictor_lock:
+            # Image embedding is shared by every box prompt below
+            original_size = self._set_frame(frame, frame_digest, image)
+            
+            # All boxes go through the mask decoder in one batched forward pass
+            boxes = torch.as_tensor(bboxes, dtype=torch.float, device=self.predictor.device)
+            transformed_boxes = self.predictor.transform.apply_boxes_torch(boxes, original_size)
+            with torch.inference_mode():
+                masks, scores, logits = self.predictor.predict_torch(
+                    point_coords=None,
+                    point_labels=None,
+                    boxes=transformed_boxes,
+                    multimask_output=True
+                )
+        
+        # Select best mask per box
+        best_mask_idx = torch.argmax(scores, dim=1)
+        return masks[torch.arange(masks.shape[0], device=masks.device), best_mask_idx].cpu().numpy()
     
     async def segment_with_points(
         self, 
@@ -80,41 +235,40 @@ class SegmentationService:
         """Segment object using point prompts"""
         try:
             if self.predictor is None:
-                return await self._mock_segmentation([100, 100, 300, 400])
+                return self._mock_segmentation([100, 100, 300, 400])
             
-            # Convert bytes to PIL Image
-            image = Image.open(io.BytesIO(frame))
-            image_array = np.array(image)
+            async with self._sam_semaphore:
+                mask = await asyncio.to_thread(
+                    self._predict_point_mask, frame, points, labels, self._frame_digest(frame)
+                )
             
-            # Set image in predictor
-            self.predictor.set_image(image_array)
+            return _encode_mask(mask)
             
-            # Convert points to numpy array
-            input_points = np.array(points)
-            input_labels = np.array(labels)
+        except Exception as e:
+            logger.warning("Error in point-based segmentation: %s", e)
+            return self._mock_segmentation([100, 100, 300, 400])
+    
+    def _predict_point_mask(
+        self,
+        frame: bytes,
+        points: List[List[float]],
+        labels: List[int],
+        frame_digest: str
+    ) -> np.ndarray:
+        """Best SAM mask for a set of point prompts"""
+        image = self._decode_uncached(frame, frame_digest)
+        with self._predictor_lock:
+            self._set_frame(frame, frame_digest, image)
             
             # Generate mask
             masks, scores, logits = self.predictor.predict(
-                point_coords=input_points,
-                point_labels=input_labels,
+                point_coords=np.array(points),
+                point_labels=np.array(labels),
                 multimask_output=True
             )
-            
-            # Select best mask
-            best_mask_idx = np.argmax(scores)
-            mask = masks[best_mask_idx]
-            
-            # Convert mask to base64
-            mask_image = Image.fromarray((mask * 255).astype(np.uint8))
-            buffer = io.BytesIO()
-            mask_image.save(buffer, format='PNG')
-            mask_b64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            
-            return mask_b64
-            
-        except Exception as e:
-            print(f"Error in point-based segmentation: {e}")
-            return await self._mock_segmentation([100, 100, 300, 400])
+        
+        # Select best mask
+        return masks[np.argmax(scores)]
     
     async def segment_garments(
         self, 
@@ -123,57 +277,56 @@ class SegmentationService:
     ) -> List[Dict[str, Any]]:
         """Segment multiple garments in frame"""
         try:
-            segmentation_results = []
+            garments = [
+                d for d in detections
+                if d["class"] in ["shirt", "pants", "dress", "skirt", "jacket"]
+            ]
+            if not garments:
+                return []
+            
+            frame_digest = self._frame_digest(frame)
+            keys = [(frame_digest, tuple(d["bbox"])) for d in garments]
+            masks = await self._cache_get(keys)
             
-            for detection in detections:
-                if detection["class"] in ["shirt", "pants", "dress", "skirt", "jacket"]:
-                    mask = await self.segment_object(frame, detection["bbox"])
-                    
-                    segmentation_results.append({
-                        "bbox": detection["bbox"],
-                        "mask": mask,
-                        "class": detection["class"],
-                        "confidence": detection["confidence"]
-                    })
+            # Decode and embed the frame once for all garments that missed the cache
+            missing = [i for i, mask in enumerate(masks) if mask is None]
+            if missing:
+                try:
+                    new_masks = await self._segment_bboxes(
+                        frame,
+                        np.array([garments[i]["bbox"] for i in missing]),
+                        frame_digest
+                    )
+                except Exception as e:
+                    logger.warning("Error in segmentation: %s", e)
+                    for i in missing:
+                        masks[i] = self._mock_segmentation(garments[i]["bbox"])
+                else:
+                    for i, mask in zip(missing, new_masks):
+                        masks[i] = mask
+                    if self.predictor is not None:
+                        await self._cache_put({keys[i]: masks[i] for i in missing})
             
-            return segmentation_results
+            return [
+                {
+                    "bbox": detection["bbox"],
+                    "mask": mask,
+                    "class": detection["class"],
+                    "confidence": detection["confidence"]
+                }
+                for detection, mask in zip(garments, masks)
+            ]
             
         except Exception as e:
-            print(f"Error in garment segmentation: {e}")
-            return await self._mock_garment_segmentation()
+            logger.warning("Error in garment segmentation: %s", e)
+            return self._mock_garment_segmentation()
     
-    async def _mock_segmentation(self, bbox: List[int]) -> str:
+    def _mock_segmentation(self, bbox: List[int]) -> str:
         """Mock segmentation for development"""
-        # Create a simple rectangular mask
+        # A simple rectangular mask, cached by size
         x1, y1, x2, y2 = bbox
-        width = x2 - x1
-        height = y2 - y1
-        
-        # Create mask image
-        mask = np.zeros((height, width), dtype=np.uint8)
-        mask[:, :] = 255  # Fill with white
-        
-        # Convert to base64
-        mask_image = Image.fromarray(mask)
-        buffer = io.BytesIO()
-        mask_image.save(buffer, format='PNG')
-        mask_b64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        
-        return mask_b64
+        return _solid_mask_b64(x2 - x1, y2 - y1)
     
-    async def _mock_garment_segmentation(self) -> List[Dict[str, Any]]:
+    def _mock_garment_segmentation(self) -> List[Dict[str, Any]]:
         """Mock garment segmentation for development"""
-        return [
-            {
-                "bbox": [120, 150, 280, 350],
-                "mask": await self._mock_segmentation([120, 150, 280, 350]),
-                "class": "shirt",
-                "confidence": 0.87
-            },
-            {
-                "bbox": [130, 350, 270, 500],
-                "mask": await self._mock_segmentation([130, 350, 270, 500]),
-                "class": "pants",
-                "confidence": 0.82
-            }
-        ]
+        return [{**result, "bbox": list(result["bbox"])} for result in self._mock_garments]
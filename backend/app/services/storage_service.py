@@ -1,15 +1,21 @@
 import os
-from typing import Optional, Dict, Any
+import re
+from typing import Optional, Dict, Any, BinaryIO
 from fastapi import UploadFile
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import io
+import shutil
+import asyncio
+import hashlib
+from cachetools import TTLCache
 
 from app.core.config import settings
 
 # Optional imports for cloud storage
 try:
     import boto3
+    from boto3.s3.transfer import TransferConfig
     BOTO3_AVAILABLE = True
 except ImportError:
     BOTO3_AVAILABLE = False
@@ -22,6 +28,33 @@ except ImportError:
     GCS_AVAILABLE = False
     print("google-cloud-storage not available - GCS storage disabled")
 
+# Client-supplied content digests (blake2b, 16 bytes)
+_CONTENT_HASH_RE = re.compile(r"[0-9a-f]{32}")
+
+# Key prefixes: digests under STYLE_PREFIX were computed by the server from the stored
+# bytes; presigned uploads only carry a client-asserted digest, so they are kept apart
+STYLE_PREFIX = "styles"
+CLIENT_UPLOAD_PREFIX = "uploads"
+
+# Object key from a stored-image URL: GCS path-style URLs carry the bucket as the first
+# path segment, S3 virtual-hosted and CDN URLs do not; local URLs end in local_storage/<key>.
+# Signed URLs end in a query string, which is not part of the key
+_URL_KEY_RE = re.compile(
+    r"^(?:https://storage\.googleapis\.com/[^/]+/|https://[^/]+/|file://.*local_storage/|file://)?(?P<key>[^?]*)",
+    re.DOTALL
+)
+
+# Chunk size for hashing spooled uploads without loading them whole
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Multipart settings for streamed S3 uploads
+S3_MULTIPART_CHUNK = 8 * 1024 * 1024
+S3_MULTIPART_CONCURRENCY = 8
+
+# Object metadata rarely changes; serve repeat lookups without a storage round-trip
+METADATA_CACHE_SIZE = 1024
+METADATA_CACHE_TTL = 60  # Seconds
+
 class StorageService:
     """Storage service for S3/GCS integration"""
     
@@ -29,6 +62,7 @@ class StorageService:
         self.s3_client = None
         self.gcs_client = None
         self.storage_type = "s3"  # Default to S3
+        self._metadata_cache = TTLCache(maxsize=METADATA_CACHE_SIZE, ttl=METADATA_CACHE_TTL)
         
         # Initialize storage clients
         self._initialize_storage()
@@ -70,21 +104,21 @@ class StorageService:
     async def upload_image(self, image_file: UploadFile) -> str:
         """Upload image to cloud storage"""
         try:
-            # Generate unique filename
-            file_extension = image_file.filename.split('.')[-1] if image_file.filename else 'jpg'
-            filename = f"styles/{uuid.uuid4().hex}.{file_extension}"
-            
-            # Read file content
-            content = await image_file.read()
+            # Content-addressed key: identical images map to one stored object
+            await image_file.seek(0)
+            digest = await asyncio.to_thread(self._hash_fileobj, image_file.file)
+            filename = self._style_key(image_file.filename, digest)
+            if await self._object_exists(filename):
+                return self._object_url(filename)
             
-            # Upload based on storage type
+            # Upload based on storage type, streaming the spooled file
             if self.storage_type == "s3" and self.s3_client:
-                return await self._upload_to_s3(content, filename, image_file.content_type)
+                return await self._upload_fileobj_to_s3(image_file.file, filename, image_file.content_type)
             elif self.storage_type == "gcs" and self.gcs_client:
-                return await self._upload_to_gcs(content, filename, image_file.content_type)
+                return await self._upload_fileobj_to_gcs(image_file.file, filename, image_file.content_type)
             else:
                 # Fallback to local storage for development
-                return await self._upload_to_local(content, filename)
+                return await self._upload_fileobj_to_local(image_file.file, filename)
                 
         except Exception as e:
             print(f"Error uploading image: {e}")
@@ -93,10 +127,12 @@ class StorageService:
     async def upload_bytes(self, image_bytes: bytes, filename: str, content_type: str = "image/jpeg") -> str:
         """Upload image bytes to cloud storage"""
         try:
-            # Generate unique filename if not provided
+            # Content-addressed filename if not provided
             if not filename:
-                file_extension = "jpg"
-                filename = f"styles/{uuid.uuid4().hex}.{file_extension}"
+                digest = hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+                filename = self._style_key(None, digest)
+                if await self._object_exists(filename):
+                    return self._object_url(filename)
             
             # Upload based on storage type
             if self.storage_type == "s3" and self.s3_client:
@@ -114,40 +150,170 @@ class StorageService:
     async def _upload_to_s3(self, content: bytes, filename: str, content_type: str) -> str:
         """Upload to AWS S3"""
         try:
-            self.s3_client.put_object(
+            await asyncio.to_thread(
+                self.s3_client.put_object,
                 Bucket=settings.AWS_S3_BUCKET,
                 Key=filename,
                 Body=content,
-                ContentType=content_type,
-                ACL='public-read'
+                ContentType=content_type
+            )
+            
+            return self._s3_object_url(filename)
+            
+        except Exception as e:
+            print(f"Error uploading to S3: {e}")
+            raise
+    
+    async def _upload_fileobj_to_s3(self, fileobj: BinaryIO, filename: str, content_type: str) -> str:
+        """Stream a file object to AWS S3 (multipart above S3_MULTIPART_CHUNK)"""
+        try:
+            await asyncio.to_thread(
+                self.s3_client.upload_fileobj,
+                fileobj,
+                settings.AWS_S3_BUCKET,
+                filename,
+                ExtraArgs={"ContentType": content_type},
+                Config=TransferConfig(
+                    multipart_threshold=S3_MULTIPART_CHUNK,
+                    multipart_chunksize=S3_MULTIPART_CHUNK,
+                    max_concurrency=S3_MULTIPART_CONCURRENCY
+                )
             )
             
-            # Return public URL
-            url = f"https://{settings.AWS_S3_BUCKET}.s3.{settings.AWS_REGION}.amazonaws.com/{filename}"
-            return url
+            return self._s3_object_url(filename)
             
         except Exception as e:
             print(f"Error uploading to S3: {e}")
             raise
     
+    def _s3_object_url(self, filename: str) -> str:
+        """
+        Read URL for a private S3 object: through the CDN when one is configured,
+        otherwise a presigned GET (signed locally, no request to S3)
+        """
+        if settings.CDN_DOMAIN:
+            return f"https://{settings.CDN_DOMAIN}/{filename}"
+        return self.s3_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": settings.AWS_S3_BUCKET, "Key": filename},
+            ExpiresIn=settings.SIGNED_GET_URL_EXPIRY
+        )
+    
+    def _gcs_object_url(self, filename: str) -> str:
+        """Read URL for a private GCS object: a V4 signed GET"""
+        blob = self.gcs_client.bucket(settings.GCS_BUCKET_NAME).blob(filename)
+        return blob.generate_signed_url(
+            version="v4",
+            expiration=timedelta(seconds=settings.SIGNED_GET_URL_EXPIRY),
+            method="GET"
+        )
+    
+    def _hash_fileobj(self, fileobj: BinaryIO) -> str:
+        """blake2b content digest of a file object, rewound afterwards for upload"""
+        hasher = hashlib.blake2b(digest_size=16)
+        for chunk in iter(lambda: fileobj.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+        fileobj.seek(0)
+        return hasher.hexdigest()
+    
+    def _style_key(self, original_filename: Optional[str], digest: Optional[str] = None, prefix: str = STYLE_PREFIX) -> str:
+        """Object key for a style image: content digest (or a random id) plus the original extension"""
+        file_extension = original_filename.split('.')[-1] if original_filename else 'jpg'
+        return f"{prefix}/{digest or uuid.uuid4().hex}.{file_extension}"
+    
+    def _object_url(self, filename: str) -> str:
+        """URL of a stored object for the active storage backend"""
+        if self.storage_type == "s3" and self.s3_client:
+            return self._s3_object_url(filename)
+        elif self.storage_type == "gcs" and self.gcs_client:
+            return self._gcs_object_url(filename)
+        else:
+            return f"file://{os.path.abspath(os.path.join('local_storage', filename))}"
+    
+    async def _object_exists(self, filename: str) -> bool:
+        """Whether an object is already stored under this key"""
+        try:
+            if self.storage_type == "s3" and self.s3_client:
+                await asyncio.to_thread(
+                    self.s3_client.head_object,
+                    Bucket=settings.AWS_S3_BUCKET,
+                    Key=filename
+                )
+                return True
+            elif self.storage_type == "gcs" and self.gcs_client:
+                blob = self.gcs_client.bucket(settings.GCS_BUCKET_NAME).blob(filename)
+                return await asyncio.to_thread(blob.exists)
+            else:
+                return os.path.exists(os.path.join("local_storage", filename))
+        except Exception:
+            # Missing object (404) or lookup failure: upload as usual
+            return False
+    
+    async def create_presigned_put(
+        self,
+        filename: str,
+        content_type: str,
+        content_hash: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Presigned S3 POST for the client's file so it uploads directly to the bucket"""
+        if not (self.storage_type == "s3" and self.s3_client):
+            raise ValueError("Direct uploads require S3 storage")
+        
+        if content_hash is not None and not _CONTENT_HASH_RE.fullmatch(content_hash):
+            raise ValueError("content_hash must be a 32-character hex blake2b digest")
+        
+        # The server never sees these bytes, so the digest is unverified: keep such keys
+        # out of the content-addressed styles/ namespace that upload_image trusts
+        key = self._style_key(filename, content_hash, CLIENT_UPLOAD_PREFIX)
+        if content_hash and await self._object_exists(key):
+            # Already stored: nothing to upload
+            return {"url": None, "fields": {}, "image_url": self._s3_object_url(key)}
+        
+        presigned = await asyncio.to_thread(
+            self.s3_client.generate_presigned_post,
+            Bucket=settings.AWS_S3_BUCKET,
+            Key=key,
+            Fields={"Content-Type": content_type},
+            Conditions=[{"Content-Type": content_type}],
+            ExpiresIn=settings.PRESIGNED_URL_EXPIRY
+        )
+        return {
+            "url": presigned["url"],
+            "fields": presigned["fields"],
+            "image_url": self._s3_object_url(key)
+        }
+    
     async def _upload_to_gcs(self, content: bytes, filename: str, content_type: str) -> str:
         """Upload to Google Cloud Storage"""
         try:
             bucket = self.gcs_client.bucket(settings.GCS_BUCKET_NAME)
             blob = bucket.blob(filename)
             
-            # Upload content
-            blob.upload_from_string(
-                content,
-                content_type=content_type
-            )
+            def upload():
+                blob.upload_from_string(
+                    content,
+                    content_type=content_type
+                )
+                # Objects stay private; readers get a signed URL
+                return self._gcs_object_url(filename)
             
-            # Make public
-            blob.make_public()
+            return await asyncio.to_thread(upload)
             
-            # Return public URL
-            url = f"https://storage.googleapis.com/{settings.GCS_BUCKET_NAME}/{filename}"
-            return url
+        except Exception as e:
+            print(f"Error uploading to GCS: {e}")
+            raise
+    
+    async def _upload_fileobj_to_gcs(self, fileobj: BinaryIO, filename: str, content_type: str) -> str:
+        """Stream a file object to Google Cloud Storage"""
+        try:
+            bucket = self.gcs_client.bucket(settings.GCS_BUCKET_NAME)
+            blob = bucket.blob(filename)
+            
+            def upload():
+                blob.upload_from_file(fileobj, content_type=content_type)
+                return self._gcs_object_url(filename)
+            
+            return await asyncio.to_thread(upload)
             
         except Exception as e:
             print(f"Error uploading to GCS: {e}")
@@ -164,8 +330,30 @@ class StorageService:
             file_path = os.path.join(local_dir, filename)
             os.makedirs(os.path.dirname(file_path), exist_ok=True)
             
-            with open(file_path, 'wb') as f:
-                f.write(content)
+            def write():
+                with open(file_path, 'wb') as f:
+                    f.write(content)
+            
+            await asyncio.to_thread(write)
+            
+            # Return local file path (in production, this would be a public URL)
+            return f"file://{os.path.abspath(file_path)}"
+            
+        except Exception as e:
+            print(f"Error uploading to local storage: {e}")
+            raise
+    
+    async def _upload_fileobj_to_local(self, fileobj: BinaryIO, filename: str) -> str:
+        """Copy a file object to local storage (for development)"""
+        try:
+            file_path = os.path.join("local_storage", filename)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            
+            def copy():
+                with open(file_path, 'wb') as f:
+                    shutil.copyfileobj(fileobj, f)
+            
+            await asyncio.to_thread(copy)
             
             # Return local file path (in production, this would be a public URL)
             return f"file://{os.path.abspath(file_path)}"
@@ -177,6 +365,8 @@ class StorageService:
     async def delete_image(self, image_url: str) -> bool:
         """Delete image from cloud storage"""
         try:
+            self._metadata_cache.pop(image_url, None)
+            
             # Extract filename from URL
             filename = self._extract_filename_from_url(image_url)
             
@@ -194,7 +384,8 @@ class StorageService:
     async def _delete_from_s3(self, filename: str) -> bool:
         """Delete from S3"""
         try:
-            self.s3_client.delete_object(
+            await asyncio.to_thread(
+                self.s3_client.delete_object,
                 Bucket=settings.AWS_S3_BUCKET,
                 Key=filename
             )
@@ -208,7 +399,7 @@ class StorageService:
         try:
             bucket = self.gcs_client.bucket(settings.GCS_BUCKET_NAME)
             blob = bucket.blob(filename)
-            blob.delete()
+            await asyncio.to_thread(blob.delete)
             return True
         except Exception as e:
             print(f"Error deleting from GCS: {e}")
@@ -228,30 +419,28 @@ class StorageService:
     
     def _extract_filename_from_url(self, url: str) -> str:
         """Extract filename from storage URL"""
-        try:
-            if url.startswith("https://"):
-                # S3 or GCS URL
-                parts = url.split("/")
-                return "/".join(parts[3:])  # Remove protocol, domain, bucket
-            elif url.startswith("file://"):
-                # Local file URL
-                return url.replace("file://", "").split("local_storage/")[-1]
-            else:
-                return url
-        except Exception:
-            return url
+        return _URL_KEY_RE.match(url).group("key")
     
     async def get_image_metadata(self, image_url: str) -> Dict[str, Any]:
         """Get image metadata from storage"""
         try:
+            metadata = self._metadata_cache.get(image_url)
+            if metadata is not None:
+                return metadata
+            
             filename = self._extract_filename_from_url(image_url)
             
             if self.storage_type == "s3" and self.s3_client:
-                return await self._get_s3_metadata(filename)
+                metadata = await self._get_s3_metadata(filename)
             elif self.storage_type == "gcs" and self.gcs_client:
-                return await self._get_gcs_metadata(filename)
+                metadata = await self._get_gcs_metadata(filename)
             else:
-                return await self._get_local_metadata(filename)
+                metadata = await self._get_local_metadata(filename)
+            
+            # Empty dicts signal a failed lookup and are not cached
+            if metadata:
+                self._metadata_cache[image_url] = metadata
+            return metadata
                 
         except Exception as e:
             print(f"Error getting image metadata: {e}")
@@ -260,7 +449,8 @@ class StorageService:
     async def _get_s3_metadata(self, filename: str) -> Dict[str, Any]:
         """Get S3 object metadata"""
         try:
-            response = self.s3_client.head_object(
+            response = await asyncio.to_thread(
+                self.s3_client.head_object,
                 Bucket=settings.AWS_S3_BUCKET,
                 Key=filename
             )
@@ -280,7 +470,7 @@ class StorageService:
         try:
             bucket = self.gcs_client.bucket(settings.GCS_BUCKET_NAME)
             blob = bucket.blob(filename)
-            blob.reload()
+            await asyncio.to_thread(blob.reload)
             
             return {
                 "size": blob.size,
@@ -1,16 +1,82 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
+import asyncio
+import logging
 import numpy as np
-import time
-import uuid
+import hashlib
+from cachetools import LRUCache, TTLCache
 
-from app.services.clip_service import CLIPService
+from app.core.database import SessionLocal
+from app.core.ids import new_style_id
+from app.core.jit import njit, NUMBA_AVAILABLE
+from app.services.clip_service import CLIPService, QuantizedEmbeddings
+from app.services.yolo_service import YOLOService
+from app.models.style_models import Style, StyleImage, add_style_images, unpack_embedding
+
+logger = logging.getLogger(__name__)
+
+# Frame embeddings kept by content hash; repeat or resubmitted frames skip the CLIP forward pass
+FRAME_EMBEDDING_CACHE_SIZE = 1024
+
+# Style embeddings are bounded and dropped after an hour, returning memory after idle periods
+STYLE_CACHE_SIZE = 10_000
+STYLE_CACHE_TTL = 3600
+
+# Detection classes that get per-garment style feedback
+GARMENT_CLASSES = frozenset(["shirt", "pants", "dress", "skirt", "jacket"])
+
+# Garment embedding used while CLIP is not loaded; identical for every garment
+MOCK_GARMENT_EMBEDDING = CLIPService.normalize(np.full(512, 0.1, dtype=np.float32))
+
+# Similarity buckets, used as indices into the feedback template tables
+MATCH_STRONG, MATCH_GOOD, MATCH_WEAK = 0, 1, 2
+
+# Per-garment (message template, priority) by bucket
+GARMENT_FEEDBACK = (
+    ("The {} perfectly matches your reference style", "medium"),
+    ("The {} works well with your reference style", "low"),
+    ("Consider a different {} to better match your reference style", "high")
+)
+
+# Overall (message template, priority) by bucket
+MATCH_FEEDBACK = (
+    ("Excellent style match! This outfit closely resembles your reference style ({:.1%} similarity)", "high"),
+    ("Good style alignment. Your outfit has {:.1%} similarity with your reference style", "medium"),
+    ("Consider adjusting your outfit to better match your reference style (current similarity: {:.1%})", "high")
+)
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def score_buckets(sims, thr_hi=0.8, thr_mid=0.6):
+        """Bucket per similarity: strong above thr_hi, good above thr_mid, weak otherwise"""
+        out = np.empty(sims.size, np.int8)
+        for i in range(sims.size):
+            if sims[i] > thr_hi:
+                out[i] = MATCH_STRONG
+            elif sims[i] > thr_mid:
+                out[i] = MATCH_GOOD
+            else:
+                out[i] = MATCH_WEAK
+        return out
+else:
+    def score_buckets(sims, thr_hi=0.8, thr_mid=0.6):
+        """Bucket per similarity: strong above thr_hi, good above thr_mid, weak otherwise"""
+        return np.where(
+            sims > thr_hi, MATCH_STRONG, np.where(sims > thr_mid, MATCH_GOOD, MATCH_WEAK)
+        ).astype(np.int8)
 
 class StyleEngine:
     """Style Engine for CLIP embeddings and style match scoring"""
     
     def __init__(self):
         self.clip_service = None
-        self.style_cache = {}  # In-memory cache for style embeddings
+        # In-memory cache: style id -> (N, 512) L2-normalized embeddings, int8-quantized per row
+        self.style_cache: "TTLCache[str, QuantizedEmbeddings]" = TTLCache(
+            maxsize=STYLE_CACHE_SIZE, ttl=STYLE_CACHE_TTL
+        )
+        # Serializes cache fills and read-modify-write updates of style_cache entries
+        self._style_lock = asyncio.Lock()
+        # blake2b(frame) -> normalized float32 frame embedding
+        self._frame_embeddings = LRUCache(maxsize=FRAME_EMBEDDING_CACHE_SIZE)
         self.similarity_threshold = 0.7
     
     async def initialize(self, clip_service: CLIPService):
@@ -21,166 +87,261 @@ class StyleEngine:
         self,
         frame: bytes,
         segmentation_results: List[Dict[str, Any]],
-        style_id: str
+        style_id: str,
+        frame_embedding: Optional[np.ndarray] = None
     ) -> List[Dict[str, Any]]:
-        """Match current frame against reference style"""
+        """Match current frame against reference style, reusing frame_embedding when already computed"""
         try:
             # Get style embeddings from cache/database
-            style_embeddings = await self.get_style_embeddings(style_id)
-            if not style_embeddings:
+            style_matrix = await self.get_style_embeddings(style_id)
+            if not len(style_matrix):
                 return [self._create_style_feedback(
                     "No reference style found", 0.0, "low"
                 )]
             
-            # Encode current frame
-            frame_embedding = await self.clip_service.encode_image(frame)
+            # Encode current frame, normalized once for the whole comparison batch
+            if frame_embedding is not None:
+                frame_vector = CLIPService.normalize(frame_embedding)
+            else:
+                frame_vector = await self._encode_frame(frame)
             
-            # Calculate similarities with all reference images
-            similarities = []
-            for ref_embedding in style_embeddings:
-                similarity = await self.clip_service.compute_image_similarity(
-                    frame_embedding, ref_embedding
-                )
-                similarities.append(similarity)
+            # Reference rows are normalized at insertion, so this is int8 dot products only
+            similarities = self.clip_service.compute_quantized_similarities(frame_vector, style_matrix)
             
             # Get best match
-            best_similarity = max(similarities) if similarities else 0.0
-            avg_similarity = np.mean(similarities) if similarities else 0.0
-            
-            # Generate feedback based on similarity
-            feedback = []
+            best_similarity = float(similarities.max())
+            avg_similarity = float(similarities.mean())
             
+            # Generate feedback based on similarity; two scalar comparisons stay in Python
             if best_similarity > self.similarity_threshold:
-                feedback.append(self._create_style_feedback(
-                    f"Excellent style match! This outfit closely resembles your reference style ({best_similarity:.1%} similarity)",
-                    best_similarity, "high"
-                ))
+                bucket, score = MATCH_STRONG, best_similarity
             elif avg_similarity > 0.5:
-                feedback.append(self._create_style_feedback(
-                    f"Good style alignment. Your outfit has {avg_similarity:.1%} similarity with your reference style",
-                    avg_similarity, "medium"
-                ))
+                bucket, score = MATCH_GOOD, avg_similarity
             else:
-                feedback.append(self._create_style_feedback(
-                    f"Consider adjusting your outfit to better match your reference style (current similarity: {avg_similarity:.1%})",
-                    avg_similarity, "high"
-                ))
+                bucket, score = MATCH_WEAK, avg_similarity
+            template, priority = MATCH_FEEDBACK[bucket]
+            feedback = [self._create_style_feedback(template.format(score), score, priority)]
             
             # Add specific garment feedback if segmentation is available
             if segmentation_results:
                 garment_feedback = await self._analyze_garment_style_match(
-                    frame, segmentation_results, style_embeddings
+                    frame, segmentation_results, style_matrix
                 )
                 feedback.extend(garment_feedback)
             
             return feedback
             
         except Exception as e:
-            print(f"Error in style matching: {e}")
+            logger.warning("Error in style matching: %s", e)
             return [self._create_style_feedback(
                 "Style matching unavailable", 0.0, "low"
             )]
     
-    async def get_style_embeddings(self, style_id: str) -> List[List[float]]:
-        """Get style embeddings from cache or database"""
+    async def detect_and_match_style(
+        self,
+        frame: bytes,
+        style_id: str,
+        yolo_service: YOLOService
+    ) -> List[Dict[str, Any]]:
+        """Detect garments and match style, overlapping YOLO detection with the CLIP frame encode"""
+        detections, frame_vector = await asyncio.gather(
+            yolo_service.detect_objects(frame),
+            self._encode_frame(frame)
+        )
+        garments = [det for det in detections if det["class"] in GARMENT_CLASSES]
+        return await self.match_style(frame, garments, style_id, frame_embedding=frame_vector)
+    
+    async def _encode_frame(self, frame: Union[bytes, str]) -> np.ndarray:
+        """Normalized CLIP embedding of a frame, cached by content hash"""
+        key = hashlib.blake2b(
+            frame if isinstance(frame, bytes) else frame.encode(), digest_size=16
+        ).digest()
+        frame_vector = self._frame_embeddings.get(key)
+        if frame_vector is None:
+            frame_vector = CLIPService.normalize(await self.clip_service.encode_image(frame))
+            # Mock embeddings are not cached so they cannot outlive a model load
+            if self.clip_service.model is not None:
+                self._frame_embeddings[key] = frame_vector
+        return frame_vector
+    
+    async def get_style_embeddings(self, style_id: str) -> QuantizedEmbeddings:
+        """Get style embeddings from cache or database as normalized, quantized (N, 512) rows"""
         try:
             # Check cache first
-            if style_id in self.style_cache:
-                return self.style_cache[style_id]
+            cached = self.style_cache.get(style_id)
+            if cached is not None:
+                return cached
             
-            # In production, fetch from database
-            # For now, return mock embeddings
-            mock_embeddings = [
-                [0.1] * 512,  # Mock embedding 1
-                [0.2] * 512,  # Mock embedding 2
-                [0.15] * 512  # Mock embedding 3
-            ]
-            
-            # Cache the embeddings
-            self.style_cache[style_id] = mock_embeddings
-            
-            return mock_embeddings
+            # Populate under the same lock as updates and deletes, checking again in case
+            # a concurrent miss filled the entry while this one waited
+            async with self._style_lock:
+                cached = self.style_cache.get(style_id)
+                if cached is not None:
+                    return cached
+                
+                stored = await asyncio.to_thread(self._load_style_from_db, style_id)
+                if stored is not None:
+                    return self._store_style_embeddings(style_id, stored)
+                
+                # Unknown style: cache mock embeddings (normalized like stored embeddings)
+                return self._store_style_embeddings(style_id, np.stack([
+                    np.full(512, 0.1, dtype=np.float32),  # Mock embedding 1
+                    np.full(512, 0.2, dtype=np.float32),  # Mock embedding 2
+                    np.full(512, 0.15, dtype=np.float32)  # Mock embedding 3
+                ]))
             
         except Exception as e:
-            print(f"Error getting style embeddings: {e}")
-            return []
+            logger.warning("Error getting style embeddings: %s", e)
+            return QuantizedEmbeddings.quantize(np.empty((0, 512), dtype=np.float32))
+    
+    def _quantize_rows(self, embeddings: np.ndarray) -> QuantizedEmbeddings:
+        """L2-normalize embeddings into (N, 512) rows and quantize them to int8"""
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(-1, 512)
+        matrix = matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12)
+        return QuantizedEmbeddings.quantize(matrix)
+    
+    def _store_style_embeddings(self, style_id: str, embeddings: np.ndarray) -> QuantizedEmbeddings:
+        """Normalize and quantize a style's embeddings once, at insertion time, and cache them"""
+        quantized = self._quantize_rows(embeddings)
+        self.style_cache[style_id] = quantized
+        return quantized
+    
+    def _load_style_from_db(self, style_id: str) -> Optional[np.ndarray]:
+        """A style's stored embeddings as an (N, 512) float32 matrix, None if it has none"""
+        db = SessionLocal()
+        try:
+            blobs = (
+                db.query(StyleImage.embedding)
+                .join(Style, StyleImage.style_id == Style.id)
+                .filter(Style.style_id == style_id, StyleImage.embedding.isnot(None))
+                .all()
+            )
+        finally:
+            db.close()
+        
+        if not blobs:
+            return None
+        return np.stack([unpack_embedding(blob) for (blob,) in blobs])
+    
+    def _save_style_to_db(
+        self,
+        style_id: str,
+        image_urls: List[str],
+        embeddings: np.ndarray,
+        tags: Optional[List[str]] = None,
+        description: Optional[str] = None
+    ):
+        """Bulk-insert a style's image rows with their embeddings in one transaction"""
+        # Mock embeddings are not persisted so they cannot outlive a model load
+        if self.clip_service.model is None:
+            embeddings = None
+        db = SessionLocal()
+        try:
+            add_style_images(db, style_id, image_urls, embeddings, tags, description)
+            db.commit()
+        finally:
+            db.close()
+    
+    def _delete_style_from_db(self, style_id: str):
+        """Delete a style row; its image rows go with it (delete-orphan cascade)"""
+        db = SessionLocal()
+        try:
+            style = db.query(Style).filter(Style.style_id == style_id).one_or_none()
+            if style is not None:
+                db.delete(style)
+                db.commit()
+        finally:
+            db.close()
     
     async def compute_similarity(
         self,
         frame: bytes,
-        style_embeddings: List[List[float]]
+        style_embeddings: np.ndarray
     ) -> float:
         """Compute similarity between frame and style embeddings"""
         try:
-            if not style_embeddings:
+            if not len(style_embeddings):
                 return 0.0
             
             # Encode frame
-            frame_embedding = await self.clip_service.encode_image(frame)
+            frame_vector = await self._encode_frame(frame)
             
-            # Calculate similarities
-            similarities = []
-            for style_embedding in style_embeddings:
-                similarity = await self.clip_service.compute_image_similarity(
-                    frame_embedding, style_embedding
-                )
-                similarities.append(similarity)
+            # Caller-supplied embeddings: normalize each row once, then dot products only
+            similarities = self.clip_service.compute_image_similarities(
+                frame_vector, CLIPService.normalize(style_embeddings)
+            )
             
             # Return average similarity
-            return float(np.mean(similarities)) if similarities else 0.0
+            return float(similarities.mean())
             
         except Exception as e:
-            print(f"Error computing similarity: {e}")
+            logger.warning("Error computing similarity: %s", e)
             return 0.0
     
+    async def find_k_most_similar(
+        self,
+        frame: bytes,
+        style_id: str,
+        k: int = 3
+    ) -> Dict[str, Any]:
+        """Top-k reference images of a style closest to the frame, best first"""
+        try:
+            style_matrix = await self.get_style_embeddings(style_id)
+            frame_vector = await self._encode_frame(frame)
+            similarities = self.clip_service.compute_quantized_similarities(frame_vector, style_matrix)
+            
+            indices = CLIPService.top_k(similarities, k)
+            return {
+                "indices": indices.tolist(),
+                "similarities": similarities[indices].tolist()
+            }
+            
+        except Exception as e:
+            logger.warning("Error finding most similar style images: %s", e)
+            return {"indices": [], "similarities": []}
+    
     async def _analyze_garment_style_match(
         self,
         frame: bytes,
         segmentation_results: List[Dict[str, Any]],
-        style_embeddings: List[List[float]]
+        style_embeddings: QuantizedEmbeddings
     ) -> List[Dict[str, Any]]:
         """Analyze individual garment style matching"""
         feedback = []
         
         try:
-            for seg_result in segmentation_results:
-                garment_class = seg_result["class"]
-                
-                # Extract garment region (simplified - in production, use actual mask)
-                bbox = seg_result["bbox"]
-                
-                # For now, create mock garment embedding
-                garment_embedding = [0.1] * 512  # Mock embedding
-                
-                # Calculate similarity with style
-                similarities = []
-                for style_embedding in style_embeddings:
-                    similarity = await self.clip_service.compute_image_similarity(
-                        garment_embedding, style_embedding
-                    )
-                    similarities.append(similarity)
-                
-                avg_similarity = np.mean(similarities) if similarities else 0.0
-                
-                # Generate garment-specific feedback
-                if avg_similarity > 0.8:
-                    feedback.append(self._create_style_feedback(
-                        f"The {garment_class} perfectly matches your reference style",
-                        avg_similarity, "medium"
-                    ))
-                elif avg_similarity > 0.6:
-                    feedback.append(self._create_style_feedback(
-                        f"The {garment_class} works well with your reference style",
-                        avg_similarity, "low"
-                    ))
-                else:
-                    feedback.append(self._create_style_feedback(
-                        f"Consider a different {garment_class} to better match your reference style",
-                        avg_similarity, "high"
-                    ))
+            if self.clip_service.model is None:
+                # Every garment shares the mock embedding, so one product against
+                # the style matrix is broadcast to all garments
+                similarities = self.clip_service.compute_quantized_similarities(
+                    MOCK_GARMENT_EMBEDDING, style_embeddings
+                )
+                avg_similarities = np.full(
+                    len(segmentation_results),
+                    similarities.mean() if len(similarities) else 0.0,
+                    dtype=np.float32
+                )
+            else:
+                # Frame is decoded once and each garment's bbox crop encoded in one batch
+                garment_matrix = await self.clip_service.encode_image_regions(
+                    frame, [seg_result["bbox"] for seg_result in segmentation_results]
+                )
+                avg_similarities = self.clip_service.compute_quantized_similarities(
+                    garment_matrix, style_embeddings
+                ).mean(axis=1)
+            
+            # Thresholds are applied to all garments at once; only message formatting happens per garment
+            buckets = score_buckets(avg_similarities, 0.8, 0.6)
+            for seg_result, avg_similarity, bucket in zip(
+                segmentation_results, avg_similarities.tolist(), buckets.tolist()
+            ):
+                template, priority = GARMENT_FEEDBACK[bucket]
+                feedback.append(self._create_style_feedback(
+                    template.format(seg_result["class"]), avg_similarity, priority
+                ))
         
         except Exception as e:
-            print(f"Error analyzing garment style match: {e}")
+            logger.warning("Error analyzing garment style match: %s", e)
         
         return feedback
     
@@ -207,25 +368,22 @@ class StyleEngine:
     ) -> str:
         """Create a new style profile"""
         try:
-            style_id = f"style_{uuid.uuid4().hex[:8]}"
-            
-            # Generate embeddings for all images
-            embeddings = []
-            for url in image_urls:
-                embedding = await self.clip_service.encode_image(url)
-                embeddings.append(embedding)
+            style_id = new_style_id()
             
-            # Store in cache (in production, store in database)
-            self.style_cache[style_id] = embeddings
+            # Generate embeddings for all images in a single batch
+            embeddings = await self.clip_service.encode_images_batch(image_urls)
             
-            # In production, save to database with metadata
-            # await self._save_style_to_db(style_id, image_urls, tags, description, embeddings)
+            # Persist first so a failed write leaves nothing cached, then cache
+            await asyncio.to_thread(
+                self._save_style_to_db, style_id, image_urls, embeddings, tags, description
+            )
+            self._store_style_embeddings(style_id, embeddings)
             
             return style_id
             
         except Exception as e:
-            print(f"Error creating style profile: {e}")
-            return f"style_{int(time.time())}"
+            logger.warning("Error creating style profile: %s", e)
+            return new_style_id()
     
     async def update_style_profile(
         self,
@@ -235,39 +393,36 @@ class StyleEngine:
     ) -> bool:
         """Update existing style profile"""
         try:
-            # Generate new embeddings
-            new_embeddings = []
-            for url in new_image_urls:
-                embedding = await self.clip_service.encode_image(url)
-                new_embeddings.append(embedding)
+            # Generate new embeddings in a single batch
+            new_embeddings = await self.clip_service.encode_images_batch(new_image_urls)
             
-            # Update cache
-            if style_id in self.style_cache:
-                self.style_cache[style_id].extend(new_embeddings)
-            else:
-                self.style_cache[style_id] = new_embeddings
+            await asyncio.to_thread(
+                self._save_style_to_db, style_id, new_image_urls, new_embeddings, new_tags
+            )
             
-            # In production, update database
-            # await self._update_style_in_db(style_id, new_image_urls, new_tags, new_embeddings)
+            # Update a cached entry in place (existing rows keep their quantization);
+            # an uncached style is loaded whole from the database on its next use
+            async with self._style_lock:
+                existing = self.style_cache.get(style_id)
+                if existing is not None:
+                    self.style_cache[style_id] = existing.stack(self._quantize_rows(new_embeddings))
             
             return True
             
         except Exception as e:
-            print(f"Error updating style profile: {e}")
+            logger.warning("Error updating style profile: %s", e)
             return False
     
     async def delete_style_profile(self, style_id: str) -> bool:
         """Delete style profile"""
         try:
-            # Remove from cache
-            if style_id in self.style_cache:
-                del self.style_cache[style_id]
-            
-            # In production, delete from database
-            # await self._delete_style_from_db(style_id)
+            # Database first, so a concurrent cache miss cannot reload the style
+            await asyncio.to_thread(self._delete_style_from_db, style_id)
+            async with self._style_lock:
+                self.style_cache.pop(style_id, None)
             
             return True
             
         except Exception as e:
-            print(f"Error deleting style profile: {e}")
+            logger.warning("Error deleting style profile: %s", e)
             return False
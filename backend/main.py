@@ -1,27 +1,76 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 import uvicorn
 import base64
-import json
+import orjson
 from typing import List, Optional
+from contextlib import asynccontextmanager
 import asyncio
+import logging
+import os
+from sqlalchemy.exc import OperationalError
 
 from app.core.config import settings
-from app.core.database import engine, Base
-from app.models import style_models, user_models
+from app.core.logging_config import setup_logging
+from app.core.database import engine, Base, SessionLocal
+from app.core.ids import new_style_id
 from app.services.ai_orchestrator import AIOrchestrator
 from app.services.storage_service import StorageService
-from app.schemas.analysis import AnalysisRequest, AnalysisResponse
+from app.schemas.analysis import AnalysisRequest, AnalysisResponse, BatchAnalysisRequest, AnalysisMode, Season
 from app.schemas.style import StyleUploadRequest, StyleResponse
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+setup_logging()
+logger = logging.getLogger(__name__)
+
+def create_tables():
+    """Create missing tables; another worker creating them concurrently is not an error"""
+    # Registers the models on Base.metadata
+    from app.models import style_models, user_models
+    
+    try:
+        Base.metadata.create_all(bind=engine, checkfirst=True)
+    except OperationalError as e:
+        if "already exists" not in str(e):
+            raise
+        logger.info("Database tables already created by another worker")
+    
+    # Databases created before embeddings moved from JSON to LargeBinary
+    with engine.begin() as connection:
+        repacked = style_models.repack_json_embeddings(connection)
+    if repacked:
+        logger.info("Repacked %d JSON style embeddings as float16 blobs", repacked)
+
+def save_style(style_id: str, image_urls: List[str], tags: List[str]):
+    """Persist an uploaded style and all of its image rows in one transaction"""
+    from app.models.style_models import add_style_images
+    
+    db = SessionLocal()
+    try:
+        add_style_images(db, style_id, image_urls, tags=tags)
+        db.commit()
+    finally:
+        db.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Database setup runs once per worker at startup instead of at import time
+    await asyncio.to_thread(create_tables)
+    
+    # Model load and first inference happen before the worker accepts requests
+    if settings.PRELOAD_YOLO:
+        from app.services.yolo_service import YOLOService
+        
+        app.state.yolo_service = YOLOService()
+        await app.state.yolo_service.warmup()
+    yield
 
 app = FastAPI(
     title="TailorAI API",
     description="AI-Powered Fashion Analysis API",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -45,7 +94,7 @@ async def analyze_fashion(request: AnalysisRequest):
     """Analyze fashion from uploaded image"""
     try:
         # Use AI orchestrator to analyze the frame
-        result = AIOrchestrator.analyze_frame(
+        result = await AIOrchestrator.analyze_frame(
             mode=request.mode,
             frame_b64=request.frame_b64,
             season=request.season,  # Pass season to AI orchestrator
@@ -55,9 +104,80 @@ async def analyze_fashion(request: AnalysisRequest):
         # Add frame count for tracking
         result["frame_count"] = 1
         
-        return result
+        return ORJSONResponse(result)
+    except Exception as e:
+        logger.error("Analysis error: %s", e)
+        raise HTTPException(status_code=500, detail="Analysis failed")
+
+@app.post("/api/analyze-binary")
+async def analyze_fashion_binary(
+    frame: UploadFile = File(...),
+    mode: AnalysisMode = Form(...),
+    season: Season = Form(Season.summer),
+    style_profile: Optional[str] = Form(None)
+):
+    """Analyze a frame uploaded as raw multipart bytes, avoiding base64 on the wire and in the decode"""
+    try:
+        profile = orjson.loads(style_profile) if style_profile else None
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="style_profile must be a JSON object")
+    
+    try:
+        result = await AIOrchestrator.analyze_frame_raw(
+            mode=mode,
+            frame=await frame.read(),
+            season=season,
+            style_profile=profile
+        )
+        
+        # Add frame count for tracking
+        result["frame_count"] = 1
+        
+        return ORJSONResponse(result)
     except Exception as e:
-        logger.error(f"Analysis error: {e}")
+        logger.error("Analysis error: %s", e)
+        raise HTTPException(status_code=500, detail="Analysis failed")
+
+@app.post("/api/analyze-stream")
+async def analyze_fashion_stream(request: AnalysisRequest):
+    """Stream feedback sections as Server-Sent Events while the AI response is generated"""
+    async def event_stream():
+        async for event in AIOrchestrator.analyze_frame_stream(
+            mode=request.mode,
+            frame_b64=request.frame_b64,
+            season=request.season,
+            style_profile=request.style_profile
+        ):
+            data = event["data"]
+            if event["event"] == "result":
+                data["frame_count"] = 1
+            yield f"event: {event['event']}\ndata: {orjson.dumps(data).decode()}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.post("/api/analyze-batch")
+async def analyze_fashion_batch(request: BatchAnalysisRequest):
+    """Analyze several frames (e.g. multi-angle captures) in one AI request"""
+    if len(request.frames_b64) > settings.MAX_FRAMES_PER_REQUEST:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.MAX_FRAMES_PER_REQUEST} frames per request"
+        )
+    
+    try:
+        results = await AIOrchestrator.analyze_frames(
+            mode=request.mode,
+            frames_b64=request.frames_b64,
+            season=request.season,
+            style_profile=request.style_profile
+        )
+        
+        for result in results:
+            result["frame_count"] = len(results)
+        
+        return ORJSONResponse({"results": results})
+    except Exception as e:
+        logger.error("Batch analysis error: %s", e)
         raise HTTPException(status_code=500, detail="Analysis failed")
 
 @app.post("/api/v1/upload-style", response_model=StyleResponse)
@@ -70,17 +190,17 @@ async def upload_style(
     """
     try:
         # Parse tags
-        tag_list = json.loads(tags) if tags else []
+        tag_list = orjson.loads(tags) if tags else []
         
-        # Upload images to cloud storage
-        image_urls = []
-        for image in images:
-            url = await storage_service.upload_image(image)
-            image_urls.append(url)
+        # Upload images to cloud storage concurrently; order of URLs follows the uploads
+        image_urls = list(await asyncio.gather(
+            *(storage_service.upload_image(image) for image in images)
+        ))
         
-        # Generate style ID (simplified - no embeddings for now)
-        import time
-        style_id = f"style_{int(time.time())}"
+        # Style and image rows go in as one bulk insert; no embeddings here, since CLIP
+        # is not loaded in the API process
+        style_id = new_style_id()
+        await asyncio.to_thread(save_style, style_id, image_urls, tag_list)
         
         return StyleResponse(
             style_id=style_id,
@@ -91,6 +211,20 @@ async def upload_style(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Style upload failed: {str(e)}")
 
+@app.post("/api/v1/upload-style/presign")
+async def presign_style_upload(
+    filename: str = Form(...),
+    content_type: str = Form("image/jpeg"),
+    content_hash: Optional[str] = Form(None)
+):
+    """
+    Presigned upload target so the client sends a style image straight to storage
+    """
+    try:
+        return await storage_service.create_presigned_put(filename, content_type, content_hash)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/api/v1/styles/{style_id}", response_model=StyleResponse)
 async def get_style(style_id: str):
     """
@@ -123,5 +257,5 @@ if __name__ == "__main__":
         "main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True
+        reload=os.environ.get("DEV") == "1"
     )
@@ -34,10 +34,14 @@ if __name__ == "__main__":
     print("⚡ Lightweight backend - no heavy AI models to load!")
     print("=" * 50)
     
+    # DEV=1 restores auto-reload (single process); otherwise one worker per CPU.
+    # Each worker loads its own models, so lower WEB_CONCURRENCY to fit GPU memory.
+    dev = os.environ.get("DEV") == "1"
     uvicorn.run(
         "main:app",
         host="127.0.0.1",
         port=8000,
-        reload=True,
+        reload=dev,
+        workers=None if dev else int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)),
         log_level="info"
     )